@@ -1,20 +1,73 @@
+import asyncio
 import logging
 import os
 from dotenv import load_dotenv
-from telegram.ext import ApplicationBuilder, CommandHandler
-
-from handlers import conv_handler, stats_handler, chart_handler, cancel_command
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, MessageHandler, filters
 
+# before importing handlers: it (and metrics, sheets, ledger) read their settings at import time
 load_dotenv()
-TOKEN = os.environ["TOKEN"]
+
+from handlers import conv_handler, stats_handler, year_command, budget_command, chart_handler, cancel_command, resync_command, stats_internal_command, import_text, import_document, export_command, warm_up, shutdown
 
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+# Serving mode: "polling" (default) or "webhook"
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")              # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or None    # checked against X-Telegram-Bot-Api-Secret-Token
+# worker processes serving updates (sharded by user, see shards.py); 1 = everything in this process
+SHARDS = int(os.environ.get("SHARDS", "1"))
+# updates handled at once (per process); webhook and sharded modes are concurrent by default, plain polling stays sequential
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "64" if BOT_MODE == "webhook" or SHARDS > 1 else "1"))
+MAX_PENDING_UPDATES = 10000  # updates accepted and waiting for their user's turn (concurrent modes)
+
+
+class PerUserApplication(Application):
+    """Handles updates from different users concurrently, but one at a time per user.
+
+    The conversation (ConversationHandler state, context.user_data) assumes a user's
+    updates arrive in order; a per-user lock keeps that true with concurrent_updates on.
+
+    PTB takes its concurrency slot before calling process_update, so updates waiting for
+    their user's lock would hold slots and one user's backlog could stall everyone. PTB's
+    limit is therefore only a bound on pending updates (MAX_PENDING_UPDATES); the real one,
+    handler_slots, is taken after the user's lock.
+    """
+
+    def __init__(self, handler_slots: int = 1, **kwargs):
+        super().__init__(**kwargs)
+        self._user_locks = {}  # user/chat id -> [lock, updates holding or waiting]
+        self._handler_slots = asyncio.Semaphore(handler_slots)
+
+    async def process_update(self, update: object) -> None:
+        if self.concurrent_updates <= 1:
+            await super().process_update(update)
+            return
+        user = getattr(update, "effective_user", None)
+        chat = getattr(update, "effective_chat", None)
+        key = user.id if user else (chat.id if chat else None)
+        if key is None:
+            async with self._handler_slots:
+                await super().process_update(update)
+            return
+        entry = self._user_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._handler_slots:
+                    await super().process_update(update)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_locks[key]
 
+
+def register_handlers(app):
     # ConversationHandler for adding expenses
     app.add_handler(conv_handler)
 
@@ -22,11 +75,64 @@ def main():
     app.add_handler(CommandHandler("today", stats_handler))
     app.add_handler(CommandHandler("month", stats_handler))
     app.add_handler(CommandHandler("summary", stats_handler))
+    app.add_handler(CommandHandler("year", year_command))
+    app.add_handler(CommandHandler("budget", budget_command))
     app.add_handler(CommandHandler("chart", chart_handler))
+    app.add_handler(CommandHandler("resync", resync_command))
+    app.add_handler(CommandHandler("export", export_command))
+    app.add_handler(CommandHandler("stats_internal", stats_internal_command))
     app.add_handler(CommandHandler("cancel", cancel_command))
 
-    print("🚀 SpendBot starting...")
-    app.run_polling(close_loop=False)
+    # Bulk import (after conv_handler, so a multi-line note mid-conversation stays a note)
+    app.add_handler(CommandHandler("import", import_text))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & filters.Regex(r"\n"), import_text))
+    app.add_handler(MessageHandler(filters.Document.ALL, import_document))
+
+
+def build_application(token: str, updater: bool = True):
+    # warm_up loads the cache and starts the Sheets writer once, before updates are served;
+    # shutdown drains the writer and saves the cache on exit
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .application_class(PerUserApplication, {"handler_slots": CONCURRENT_UPDATES})
+        .concurrent_updates(MAX_PENDING_UPDATES if CONCURRENT_UPDATES > 1 else 1)
+        .post_init(warm_up)
+        .post_shutdown(shutdown)
+    )
+    if not updater:
+        builder = builder.updater(None)  # shard workers get updates handed to them
+    app = builder.build()
+    register_handlers(app)
+    return app
+
+
+def serve(app):
+    """Run the application until stopped, by webhook or long polling (BOT_MODE)."""
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise SystemExit("BOT_MODE=webhook needs WEBHOOK_URL")
+        print(f"🚀 SpendBot starting (webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, {CONCURRENT_UPDATES} concurrent updates)...")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            close_loop=False,
+        )
+    else:
+        print("🚀 SpendBot starting...")
+        app.run_polling(close_loop=False)
+
+
+def main():
+    token = os.environ["TOKEN"]
+    if SHARDS > 1:
+        import shards
+        shards.run(token, SHARDS)
+        return
+    serve(build_application(token))
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -10,28 +11,70 @@ from telegram.ext import (
     filters,
 )
 
-import gspread
-
 # Load .env variables
 load_dotenv()
 TOKEN = os.environ.get('TOKEN')
 USERNAME = os.environ.get('USER_NAME')
 USER_ID = os.environ.get('USER_ID')
 
-# Google Sheets setup
-gc = gspread.service_account(filename='credentials.json')
-sh = gc.open("myexpenses")
-current_month = datetime.now().strftime('%B')
+# Single-user mode keeps its own spreadsheet
+# (set before importing handlers/sheets, which read it at import time)
+os.environ.setdefault('SHEET_NAME', 'myexpenses')
+
+import handlers
+from utils import parse_amount
+
+# Unauthorized access log: buffered in memory, written by a background task
+ACCESS_LOG_FILE = 'logs.csv'
+ACCESS_LOG_FLUSH_INTERVAL = 5.0
+_access_log: list = []
+
+
+def _write_access_log(lines: list):
+    with open(ACCESS_LOG_FILE, 'a') as f:
+        f.write(''.join(lines))
+
 
-# Create worksheet for current month if not exists
-if current_month not in [ws.title for ws in sh.worksheets()]:
-    sh.add_worksheet(title=current_month, rows="300", cols="10")
+async def _flush_access_log():
+    if not _access_log:
+        return
+    lines = _access_log[:]
+    _access_log.clear()
+    await asyncio.to_thread(_write_access_log, lines)
+
+
+async def _access_log_writer():
+    while True:
+        await asyncio.sleep(ACCESS_LOG_FLUSH_INTERVAL)
+        try:
+            await _flush_access_log()
+        except Exception as e:
+            print("[access_log] write failed:", e)
 
-worksheet = sh.worksheet(current_month)
 
-# Add headers if empty
-if not worksheet.acell('A1').value:
-    worksheet.append_row(['Date', 'Description', 'Amount'])
+async def _post_init(application):
+    # Sheet setup, cache load and the Sheets writer all start here, not at import
+    await handlers.warm_up(application, start_charts=False)  # no chart command here
+    asyncio.create_task(_access_log_writer())
+
+
+async def _post_shutdown(application):
+    # write out buffered access-log lines, then drain Sheets writes
+    try:
+        await _flush_access_log()
+    except Exception as e:
+        print("[access_log] write failed:", e)
+    await handlers.shutdown(application)
+
+
+def _owner_key() -> str:
+    return handlers._user_key(USERNAME, USER_ID)
+
+
+# rows typed into the sheet by hand (no User cell) belong to the owner
+if 'SHEET_DEFAULT_USER' not in os.environ:
+    handlers.SHEET_DEFAULT_USER = _owner_key()
+
 
 # Message Handler
 async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -40,8 +83,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if user.username != USERNAME and str(user.id) != USER_ID:
         now = datetime.now()
-        with open('logs.csv', 'a') as f:
-            f.write(f"{now.strftime('%d/%m/%Y')},{now.strftime('%H:%M:%S')},{user.id},{user.username},{user.first_name},{user.last_name}\n")
+        _access_log.append(f"{now.strftime('%d/%m/%Y')},{now.strftime('%H:%M:%S')},{user.id},{user.username},{user.first_name},{user.last_name}\n")
         return
 
     if message == '/start':
@@ -51,15 +93,15 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("pong")
 
     elif message == 'today':
+        # served from the in-memory partition, no Sheets call
         today = datetime.now().strftime('%d/%m/%Y')
-        records = worksheet.get_all_records()
-        today_records = [r for r in records if r['Date'] == today]
-        total = sum(float(r['Amount']) for r in today_records)
+        part = handlers._get_partition(_owner_key(), handlers._date_to_month_key(today))
+        total = part["days"].get(today, 0.0) if part else 0.0
         await update.message.reply_text(f"Today's expenses: ₹{total}")
 
     elif message == 'month':
-        records = worksheet.get_all_records()
-        total = sum(float(r['Amount']) for r in records)
+        part = handlers._get_partition(_owner_key(), datetime.now().strftime('%Y-%m'))
+        total = part["total"] if part else 0.0
         await update.message.reply_text(f"This month's expenses: ₹{total}")
 
     elif ',' in message:
@@ -74,7 +116,15 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         try:
-            worksheet.append_row([date, description, amount])
+            datetime.strptime(date, '%d/%m/%Y')
+            value = parse_amount(amount)
+        except ValueError:
+            await update.message.reply_text("Invalid date or amount. Use: Date (DD/MM/YYYY), Description, Amount")
+            return
+
+        try:
+            # ledger + cache update now, Sheets append in the background writer
+            await handlers.add_expense(date, description, value, "", _owner_key())
             await update.message.reply_text(f"✅ Expense added:\nDate: {date}\nDescription: {description}\nAmount: ₹{amount}")
         except Exception as e:
             await update.message.reply_text(f"❌ Error: {e}")
@@ -84,7 +134,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # MAIN
 if __name__ == "__main__":
     print("🚀 Bot is starting...")
-    app = ApplicationBuilder().token(TOKEN).build()
+    app = ApplicationBuilder().token(TOKEN).post_init(_post_init).post_shutdown(_post_shutdown).build()
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), message_handler))
     app.add_handler(MessageHandler(filters.COMMAND, message_handler))
-    app.run_polling()
\ No newline at end of file
+    app.run_polling()
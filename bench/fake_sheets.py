@@ -0,0 +1,195 @@
+# bench/fake_sheets.py — in-process stand-in for the gspread surface sheets.py uses
+import random
+import re
+import threading
+import time
+
+import gspread
+
+
+class _FakeResponse:
+    """Just enough of requests.Response for gspread.exceptions.APIError."""
+
+    def __init__(self, status_code: int, message: str, status: str):
+        self.status_code = status_code
+        self.text = message
+        self._body = {"error": {"code": status_code, "message": message, "status": status}}
+
+    def json(self):
+        return self._body
+
+
+def quota_error() -> gspread.exceptions.APIError:
+    return gspread.exceptions.APIError(
+        _FakeResponse(429, "Quota exceeded for quota metric 'Write requests'", "RATE_LIMIT_EXCEEDED"))
+
+
+class FakeBackend:
+    """Shared behaviour knobs and call accounting for one fake spreadsheet.
+
+    latency:      seconds slept per API call (simulates the network round trip)
+    failure_rate: probability a call raises ConnectionError
+    applied_failure_rate: probability a write is applied and *then* raises (a timed-out append)
+    reads_per_minute / writes_per_minute: quota; exceeding it raises a 429 APIError
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, applied_failure_rate=0.0,
+                 reads_per_minute=10_000, writes_per_minute=10_000, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.applied_failure_rate = applied_failure_rate
+        self.quota = {"read": reads_per_minute, "write": writes_per_minute}
+        self.rng = random.Random(seed)
+        self.calls = {"read": 0, "write": 0}
+        self.errors = {"quota": 0, "failure": 0}
+        self._window = {"read": [], "write": []}
+        self._lock = threading.Lock()
+
+    def call(self, kind: str):
+        """Account for one API call: latency, quota window, random failure."""
+        time.sleep(self.latency)
+        with self._lock:
+            now = time.monotonic()
+            window = [t for t in self._window[kind] if now - t < 60.0]
+            self._window[kind] = window
+            self.calls[kind] += 1
+            if len(window) >= self.quota[kind]:
+                self.errors["quota"] += 1
+                raise quota_error()
+            window.append(now)
+            if self.rng.random() < self.failure_rate:
+                self.errors["failure"] += 1
+                raise ConnectionError("simulated Sheets failure")
+
+    def applied_then_failed(self) -> bool:
+        with self._lock:
+            if self.rng.random() < self.applied_failure_rate:
+                self.errors["failure"] += 1
+                return True
+            return False
+
+
+def _col_index(letters: str) -> int:
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch.upper()) - 64
+    return n - 1
+
+
+def _parse_range(rng: str):
+    """'A5:F' / 'F10:F' / 'A1' -> (first_row, first_col, last_col)."""
+    m = re.match(r"([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$", rng)
+    first_col = _col_index(m.group(1))
+    first_row = int(m.group(2) or 1)
+    last_col = _col_index(m.group(3)) if m.group(3) else first_col
+    return first_row, first_col, last_col
+
+
+def _trim(row: list) -> list:
+    row = list(row)
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+class FakeWorksheet:
+    def __init__(self, backend: FakeBackend, title: str):
+        self.backend = backend
+        self.title = title
+        self.rows: list = []
+        self._lock = threading.Lock()
+
+    class _Cell:
+        def __init__(self, value):
+            self.value = value
+
+    def acell(self, label: str):
+        self.backend.call("read")
+        row, col, _ = _parse_range(label)
+        with self._lock:
+            try:
+                return self._Cell(self.rows[row - 1][col] or None)
+            except IndexError:
+                return self._Cell(None)
+
+    def append_rows(self, rows: list):
+        self.backend.call("write")
+        with self._lock:
+            first = len(self.rows) + 1
+            self.rows.extend([[str(c) for c in row] for row in rows])
+            last = len(self.rows)
+        if self.backend.applied_then_failed():
+            raise TimeoutError("simulated timeout after the append was applied")
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:F{last}", "updatedRows": len(rows)}}
+
+    def values(self, rng: str) -> list:
+        first_row, first_col, last_col = _parse_range(rng)
+        with self._lock:
+            return [_trim(r[first_col:last_col + 1]) for r in self.rows[first_row - 1:]]
+
+    def get(self, rng: str):
+        self.backend.call("read")
+        return self.values(rng)
+
+    def get_all_records(self):
+        self.backend.call("read")
+        with self._lock:
+            if not self.rows:
+                return []
+            header = self.rows[0]
+            return [dict(zip(header, r + [""] * (len(header) - len(r)))) for r in self.rows[1:]]
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+        self._sheets: dict = {}
+        self._lock = threading.Lock()
+
+    def worksheets(self):
+        self.backend.call("read")
+        with self._lock:
+            return list(self._sheets.values())
+
+    def worksheet(self, title: str):
+        self.backend.call("read")
+        with self._lock:
+            if title not in self._sheets:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return self._sheets[title]
+
+    def add_worksheet(self, title: str, rows=None, cols=None):
+        self.backend.call("write")
+        with self._lock:
+            return self._sheets.setdefault(title, FakeWorksheet(self.backend, title))
+
+    def values_batch_get(self, ranges: list, params=None):
+        self.backend.call("read")
+        out = []
+        for rng in ranges:
+            title, _, cells = rng.rpartition("!")
+            ws = self._sheets.get(title.strip("'"))
+            out.append({"range": rng, "values": ws.values(cells) if ws else []})
+        return {"valueRanges": out}
+
+
+class FakeClient:
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+        self.spreadsheet = FakeSpreadsheet(backend)
+
+    def open(self, title: str):
+        self.backend.call("read")
+        return self.spreadsheet
+
+
+def install(backend: FakeBackend):
+    """Point sheets.py at a fresh fake client; returns the FakeSpreadsheet for inspection."""
+    import sheets
+    client = FakeClient(backend)
+    sheets._gc = client
+    sheets._sh = client.spreadsheet
+    sheets._ws_cache.clear()
+    sheets._header_ok.clear()
+    sheets._last_row.clear()
+    return client.spreadsheet
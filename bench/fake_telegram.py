@@ -0,0 +1,87 @@
+# bench/fake_telegram.py — local Bot API and synthetic updates for driving the handlers
+import asyncio
+import itertools
+import json
+import time
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "SpendBot", "username": "spend_bot"}
+
+
+class FakeRequest(BaseRequest):
+    """Answers every Bot API method locally after `latency` seconds; counts calls per method."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: dict = {}
+        self._msg_ids = itertools.count(1000)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText", "sendPhoto", "sendDocument"):
+            result = {
+                "message_id": next(self._msg_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0) or 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class UpdateFactory:
+    """Builds Update objects as Telegram would deliver them, one private chat per user."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._msg_ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def _message(self, user_id: int, text: str) -> dict:
+        msg = {
+            "message_id": next(self._msg_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return msg
+
+    def text(self, user_id: int, text: str) -> Update:
+        data = {"update_id": next(self._update_ids), "message": self._message(user_id, text)}
+        return Update.de_json(data, self.bot)
+
+    def callback(self, user_id: int, data: str) -> Update:
+        payload = {
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": dict(self._message(user_id, "Please confirm"), **{"from": BOT_USER}),
+            },
+        }
+        return Update.de_json(payload, self.bot)
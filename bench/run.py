@@ -0,0 +1,182 @@
+# bench/run.py — reproducible throughput / latency numbers for the bot's hot paths
+#
+#   python -m bench.run                       # defaults
+#   python -m bench.run --users 50 --expenses 20 --sheets-latency 0.2 --out bench_output.txt
+#
+# Everything runs in-process: a fake Bot API (bench.fake_telegram) and a fake
+# spreadsheet (bench.fake_sheets) stand in for Telegram and Google. Cache, ledger
+# and delta files go to a temporary directory.
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from telegram.ext import ApplicationBuilder
+
+import app as bot_app
+import charts
+import handlers
+import ledger
+import sheets
+from ratelimit import TokenBucket
+from bench.fake_sheets import FakeBackend, install
+from bench.fake_telegram import FakeRequest, UpdateFactory
+
+CATEGORIES = ["food", "transport", "groceries", "bills", "health"]
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _summary(name: str, latencies: list, elapsed: float) -> dict:
+    return {
+        "path": name,
+        "count": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def _timed(application, update, sink: list):
+    t = time.perf_counter()
+    await application.process_update(update)
+    sink.append(time.perf_counter() - t)
+
+
+async def _add_expenses(application, factory, user_id: int, count: int, rng: random.Random, confirm_lat: list):
+    for _ in range(count):
+        await application.process_update(factory.text(user_id, "/start"))
+        await application.process_update(factory.callback(user_id, f"cat|{rng.choice(CATEGORIES)}"))
+        await application.process_update(factory.text(user_id, f"{rng.randint(10, 500)}"))
+        await application.process_update(factory.text(user_id, "/skip"))
+        await _timed(application, factory.callback(user_id, "confirm|yes"), confirm_lat)
+
+
+async def _wait_for_drain(timeout: float) -> float:
+    """Seconds until every ledger row is confirmed in the fake sheet."""
+    t = time.perf_counter()
+    while ledger.pending_rows():
+        if time.perf_counter() - t > timeout:
+            break
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - t
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    backend = FakeBackend(latency=args.sheets_latency, failure_rate=args.failure_rate,
+                          applied_failure_rate=args.applied_failure_rate,
+                          reads_per_minute=args.quota, writes_per_minute=args.quota, seed=args.seed)
+    spreadsheet = install(backend)
+    sheets.read_limiter = TokenBucket(args.quota)
+    sheets.write_limiter = TokenBucket(args.quota)
+    handlers.RECONCILE_INTERVAL = 3600.0  # keep the reconciler's periodic pass out of the numbers
+
+    request = FakeRequest(latency=args.telegram_latency)
+    application = ApplicationBuilder().token("1:bench").request(request).get_updates_request(FakeRequest()).build()
+    bot_app.register_handlers(application)
+    await application.initialize()
+    await handlers.warm_up(application)
+    factory = UpdateFactory(application.bot)
+    users = [100 + i for i in range(args.users)]
+    results = []
+
+    # confirm: every user adds expenses concurrently
+    confirm_lat: list = []
+    t = time.perf_counter()
+    await asyncio.gather(*[_add_expenses(application, factory, u, args.expenses, rng, confirm_lat) for u in users])
+    results.append(_summary("confirm", confirm_lat, time.perf_counter() - t))
+
+    # writer drain: time until the background writer has pushed everything to the sheet
+    rows = len(confirm_lat)
+    drain = await _wait_for_drain(args.drain_timeout)
+    results.append({
+        "path": "writer_drain", "count": rows, "seconds": round(drain, 3),
+        "throughput_per_s": round(rows / drain, 1) if drain > 0 else float(rows),
+        "pending_after": len(ledger.pending_rows()),
+    })
+
+    # stats
+    today = time.strftime("%d/%m/%Y")
+    stats_lat: list = []
+    t = time.perf_counter()
+    for _ in range(args.repeats):
+        for u in users:
+            for cmd in ("/today", "/month", "/summary", f"/summary 01/01/2000:{today}", f"/summary 01/01/2000:{today} food"):
+                await _timed(application, factory.text(u, cmd), stats_lat)
+    results.append(_summary("stats", stats_lat, time.perf_counter() - t))
+
+    # chart: first render per user is cold, repeats hit the PNG cache
+    cold: list = []
+    warm: list = []
+    t = time.perf_counter()
+    for u in users[: args.chart_users]:
+        await _timed(application, factory.text(u, "/chart pie"), cold)
+    results.append(_summary("chart_cold", cold, time.perf_counter() - t))
+    t = time.perf_counter()
+    for _ in range(args.repeats):
+        for u in users[: args.chart_users]:
+            await _timed(application, factory.text(u, "/chart pie"), warm)
+    results.append(_summary("chart_cached", warm, time.perf_counter() - t))
+
+    sheet_rows = sum(max(0, len(ws.rows) - 1) for title, ws in spreadsheet._sheets.items() if title != sheets.INDEX_SHEET)
+    report = {
+        "config": vars(args),
+        "results": results,
+        "sheets_calls": backend.calls,
+        "sheets_errors": backend.errors,
+        "sheet_rows": sheet_rows,
+        "telegram_calls": request.calls,
+    }
+    charts.shutdown_pool()
+    await application.shutdown()
+    return report
+
+
+def _format(report: dict) -> str:
+    lines = [f"{'path':<14}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}"]
+    for r in report["results"]:
+        if "p50_ms" in r:
+            lines.append(f"{r['path']:<14}{r['count']:>8}{r['throughput_per_s']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}")
+        else:
+            lines.append(f"{r['path']:<14}{r['count']:>8}{r['throughput_per_s']:>10}  ({r['seconds']}s, {r['pending_after']} pending)")
+    lines.append(f"sheets calls: {report['sheets_calls']}  errors: {report['sheets_errors']}  rows in sheet: {report['sheet_rows']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SpendBot benchmark (fake Telegram + fake Sheets)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--expenses", type=int, default=10, help="expenses per user")
+    parser.add_argument("--repeats", type=int, default=5, help="stats/chart repetitions per user")
+    parser.add_argument("--chart-users", type=int, default=5)
+    parser.add_argument("--sheets-latency", type=float, default=0.05)
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--applied-failure-rate", type=float, default=0.0)
+    parser.add_argument("--quota", type=int, default=10_000, help="Sheets reads/writes per minute")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the JSON report here (e.g. bench_output.txt)")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None
+    os.chdir(tempfile.mkdtemp(prefix="spendbot-bench-"))
+    report = asyncio.run(run(args))
+    print(_format(report))
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# budgets.py — monthly budgets per user (overall and per category) and threshold alerts
+# Spend itself comes from the month partitions; this only holds the limits, indexed so an
+# expense checks just the thresholds of its own user's overall and category budgets.
+ALERT_LEVELS = (0.8, 1.0)   # fractions of a budget that trigger an alert
+OVERALL = "*"               # scope of the whole-month budget (other scopes are categories)
+
+
+class Budgets:
+    """(user, scope) -> monthly limit, with the alert amounts precomputed."""
+
+    def __init__(self):
+        self._by_user: dict = {}   # user -> {scope: (limit, (threshold, ...))}
+        self.chats: dict = {}      # user -> chat id alerts are sent to
+
+    def set(self, user: str, scope: str, limit: float, chat_id=None):
+        """Set a limit; a limit <= 0 removes the budget."""
+        scopes = self._by_user.setdefault(user, {})
+        if limit > 0:
+            scopes[scope] = (float(limit), tuple(float(limit) * level for level in ALERT_LEVELS))
+        else:
+            scopes.pop(scope, None)
+        if not scopes:
+            del self._by_user[user]
+        if chat_id is not None:
+            self.chats[user] = chat_id
+
+    def limits_for(self, user: str) -> dict:
+        """{scope: limit} for one user (empty when they have no budgets)."""
+        return {scope: limit for scope, (limit, _) in self._by_user.get(user, {}).items()}
+
+    def watches(self, user: str) -> bool:
+        return user in self._by_user
+
+    def crossed(self, user: str, scope: str, before: float, after: float) -> list:
+        """Alert levels whose threshold lies in (before, after]: spend moved past them. O(len(ALERT_LEVELS))."""
+        entry = self._by_user.get(user, {}).get(scope)
+        if entry is None or after <= before:
+            return []
+        limit, thresholds = entry
+        return [(level, limit) for level, t in zip(ALERT_LEVELS, thresholds) if before < t <= after]
+
+    def clear(self):
+        self._by_user.clear()
+        self.chats.clear()
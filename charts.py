@@ -1,25 +1,217 @@
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import tempfile, os
+# charts.py — chart rendering off the event loop.
+# matplotlib is imported lazily inside worker processes; the bot process never loads it.
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-def pie_chart_from_dict(data: dict, title="Expenses by Category"):
+import metrics
+
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", "2"))
+CHART_CACHE_SIZE = 64  # rendered PNGs kept in memory
+MAX_POINTS = 90        # trend charts are bucketed down to at most this many points
+
+_pool: ProcessPoolExecutor | None = None
+_png_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+
+def _new_figure():
+    """Figure via the object-oriented API (no pyplot global state)."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _to_png(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+
+def pie_chart_png(data: dict, title="Expenses by Category"):
     if not data:
         return None
 
     labels = list(data.keys())
     sizes = list(data.values())
 
-    fig, ax = plt.subplots()
+    fig = _new_figure()
+    ax = fig.add_subplot()
     ax.pie(sizes, labels=labels, autopct="%1.1f%%", startangle=90, textprops={"fontsize": 8})
     ax.axis("equal")
     ax.set_title(title)
+    return _to_png(fig)
+
+
+def pie_chart_from_dict(data: dict, title="Expenses by Category"):
+    """Render a pie chart in the current process; returns a BytesIO PNG or None."""
+    png = pie_chart_png(data, title)
+    return io.BytesIO(png) if png is not None else None
+
+
+def bar_chart_png(data: dict, title="Expenses by Category"):
+    if not data:
+        return None
+
+    items = sorted(data.items(), key=lambda kv: kv[1])
+    labels = [k for k, _ in items]
+    values = [v for _, v in items]
+
+    fig = _new_figure()
+    fig.set_size_inches(6, max(2.5, 0.4 * len(labels) + 1))
+    ax = fig.add_subplot()
+    ax.barh(labels, values)
+    ax.set_xlabel("Amount (₹)")
+    ax.set_title(title)
+    return _to_png(fig)
+
+
+def bucket_series(x, y, max_points=MAX_POINTS):
+    """Sum y into at most max_points equal-width buckets over integer x (gaps become 0).
+
+    Returns (bucket_start_x, bucket_sums, bucket_width) as NumPy arrays/int.
+    """
+    import numpy as np
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.size == 0:
+        return x, y, 1
+    lo = int(x.min())
+    span = int(x.max()) - lo + 1
+    width = max(1, -(-span // max_points))
+    sums = np.bincount((x - lo) // width, weights=y)
+    starts = lo + np.arange(sums.size, dtype=np.int64) * width
+    return starts, sums, width
+
+
+def bucket_points(x, y, max_points=MAX_POINTS) -> dict:
+    """Bucketed trend data to hand to the render pool: {"points": [[start_x, sum], ...], "width": n}.
+
+    Built in the bot process, so the series sent (and hashed for the PNG cache) is at most
+    max_points long however many days or months it covers. Empty dict when there is no data.
+    """
+    if not len(x):
+        return {}
+    starts, sums, width = bucket_series(x, y, max_points)
+    return {"points": [[int(s), float(v)] for s, v in zip(starts, sums)], "width": width}
+
+
+def _trend_png(labels, values, title, ylabel="Amount (₹)"):
+    fig = _new_figure()
+    fig.set_size_inches(8, 3.5)
+    ax = fig.add_subplot()
+    ax.plot(range(len(values)), values, marker="o" if len(values) <= 31 else None)
+    step = max(1, len(labels) // 8)
+    ax.set_xticks(range(0, len(labels), step))
+    ax.set_xticklabels(labels[::step], rotation=30, ha="right", fontsize=8)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.grid(True, alpha=0.3)
+    return _to_png(fig)
+
+
+def daily_trend_png(data: dict, title="Daily spend"):
+    """data: bucket_points() over day ordinals."""
+    if not data:
+        return None
+    from datetime import date
+    labels = [date.fromordinal(d).strftime("%d/%m/%y") for d, _ in data["points"]]
+    if data["width"] > 1:
+        title = f"{title} (per {data['width']} days)"
+    return _trend_png(labels, [v for _, v in data["points"]], title)
+
+
+def monthly_trend_png(data: dict, title="Monthly spend"):
+    """data: bucket_points() over month indexes (year * 12 + month - 1)."""
+    if not data:
+        return None
+    labels = [f"{i // 12}-{i % 12 + 1:02d}" for i, _ in data["points"]]
+    if data["width"] > 1:
+        title = f"{title} (per {data['width']} months)"
+    return _trend_png(labels, [v for _, v in data["points"]], title)
+
+
+_RENDERERS = {
+    "pie": pie_chart_png,
+    "bar": bar_chart_png,
+    "daily": daily_trend_png,
+    "monthly": monthly_trend_png,
+}
+
+
+def _render(chart_type: str, data, title: str):
+    """Runs inside a pool worker."""
+    return _RENDERERS[chart_type](data, title)
+
+
+def _init_worker():
+    # pay the matplotlib import once per worker, not on the first /chart
+    import matplotlib
+    matplotlib.use("Agg")
+    _new_figure()
+
+
+def _ping():
+    return os.getpid()
+
+
+def start_pool():
+    """Create the render pool and pre-warm every worker (safe to call more than once)."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    ctx = multiprocessing.get_context("spawn")
+    _pool = ProcessPoolExecutor(max_workers=CHART_WORKERS, mp_context=ctx, initializer=_init_worker)
+    for _ in range(CHART_WORKERS):
+        _pool.submit(_ping)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _cache_key(chart_type: str, data, title: str) -> tuple:
+    digest = hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return chart_type, title, digest
 
-    path = _tempfile_path(".png")
-    fig.savefig(path, bbox_inches="tight")
-    plt.close(fig)
-    return path
 
-def _tempfile_path(suffix=".png"):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        return tmp.name
+async def render_chart(chart_type: str, data, title: str):
+    """Render a chart to PNG bytes in the process pool, serving repeats from an LRU cache."""
+    if chart_type not in _RENDERERS:
+        raise ValueError(f"Unknown chart type: {chart_type}")
+    key = _cache_key(chart_type, data, title)
+    png = _png_cache.get(key)
+    if png is not None:
+        _png_cache.move_to_end(key)
+        metrics.CHART_CACHE_HITS.labels(chart=chart_type).inc()
+        return png
+    loop = asyncio.get_running_loop()
+    t = time.perf_counter()
+    pool = start_pool()
+    try:
+        png = await loop.run_in_executor(pool, _render, chart_type, data, title)
+    except BrokenProcessPool:
+        # a worker died (OOM, crash, kill): that pool is unusable from now on, retry once on a
+        # fresh one (unless a concurrent render already replaced it)
+        if _pool is pool:
+            print("[charts] render pool broken, restarting it")
+            shutdown_pool()
+        png = await loop.run_in_executor(start_pool(), _render, chart_type, data, title)
+    metrics.CHART_RENDER.labels(chart=chart_type).observe(time.perf_counter() - t)
+    if png is not None:
+        _png_cache[key] = png
+        while len(_png_cache) > CHART_CACHE_SIZE:
+            _png_cache.popitem(last=False)
+    return png
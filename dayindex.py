@@ -0,0 +1,47 @@
+# dayindex.py — day-ordinal index for O(log n) date-range totals
+from datetime import date, datetime
+
+# Days are stored as offsets from BASE_ORDINAL into a Fenwick (binary indexed) tree.
+# The tree is kept in a dict so only touched nodes use memory; SIZE covers ~700 years.
+BASE_ORDINAL = date(1900, 1, 1).toordinal()
+SIZE = 1 << 18
+
+
+def day_ordinal(date_s: str) -> int:
+    """'DD/MM/YYYY' -> proleptic Gregorian ordinal (raises ValueError on bad input)."""
+    return datetime.strptime(date_s, "%d/%m/%Y").toordinal()
+
+
+class DayIndex:
+    """Running totals per day supporting point updates and inclusive range sums in O(log n)."""
+
+    def __init__(self):
+        self._tree = {}
+
+    def clear(self):
+        self._tree.clear()
+
+    def add(self, ordinal: int, amount: float):
+        i = ordinal - BASE_ORDINAL + 1
+        if i < 1 or i > SIZE:
+            return
+        tree = self._tree
+        while i <= SIZE:
+            tree[i] = tree.get(i, 0.0) + amount
+            i += i & -i
+
+    def _prefix(self, ordinal: int) -> float:
+        """Sum of all days <= ordinal."""
+        i = min(ordinal - BASE_ORDINAL + 1, SIZE)
+        total = 0.0
+        tree = self._tree
+        while i > 0:
+            total += tree.get(i, 0.0)
+            i -= i & -i
+        return total
+
+    def range_total(self, start_ordinal: int, end_ordinal: int) -> float:
+        """Total for start..end inclusive; 0 if the range is empty."""
+        if end_ordinal < start_ordinal:
+            return 0.0
+        return self._prefix(end_ordinal) - self._prefix(start_ordinal - 1)
@@ -0,0 +1,76 @@
+# exporter.py — write a user's history from the ledger to a compressed CSV or Parquet file
+# Rows are streamed from SQLite in chunks, so memory stays bounded whatever the range.
+# Blocking: run from a worker thread.
+import calendar
+import csv
+import gzip
+import io
+from datetime import date, datetime
+
+import ledger
+
+EXPORT_CHUNK_ROWS = 2000
+CSV_HEADER = ["Date", "Category", "Amount", "Notes", "TxID"]
+
+
+def parse_range(arg: str | None) -> tuple:
+    """'' / 'all', 'YYYY', 'YYYY-MM' or 'DD/MM/YYYY:DD/MM/YYYY' -> (start, end) day ordinals."""
+    arg = (arg or "").strip()
+    if not arg or arg == "all":
+        return date.min.toordinal(), date.max.toordinal()
+    if ":" in arg:
+        start_s, end_s = arg.split(":", 1)
+        return (datetime.strptime(start_s, "%d/%m/%Y").toordinal(),
+                datetime.strptime(end_s, "%d/%m/%Y").toordinal())
+    if len(arg) == 7:
+        dt = datetime.strptime(arg, "%Y-%m")
+        last = calendar.monthrange(dt.year, dt.month)[1]
+        return dt.toordinal(), date(dt.year, dt.month, last).toordinal()
+    year = datetime.strptime(arg, "%Y").year
+    return date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+
+
+def write_csv_gz(chunks, path: str) -> int:
+    """Gzip-compressed CSV in the sheet's column order; returns rows written."""
+    n = 0
+    with gzip.open(path, "wb") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for chunk in chunks:
+            writer.writerows((date_s, category, f"{amount:.2f}", note, tx_id or "")
+                             for _, date_s, category, amount, note, tx_id in chunk)
+            n += len(chunk)
+    return n
+
+
+def write_parquet(chunks, path: str) -> int:
+    """Parquet (one row group per chunk, zstd); needs pyarrow. Returns rows written."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs pyarrow (pip install pyarrow); use csv instead")
+    schema = pa.schema([("date", pa.date32()), ("category", pa.string()), ("amount", pa.float64()),
+                        ("note", pa.string()), ("tx_id", pa.string())])
+    n = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.table({
+                "date": [date.fromordinal(d) for d in columns[0]],
+                "category": list(columns[2]),
+                "amount": list(columns[3]),
+                "note": list(columns[4]),
+                "tx_id": list(columns[5]),
+            }, schema=schema))
+            n += len(chunk)
+    return n
+
+
+WRITERS = {"csv": (write_csv_gz, ".csv.gz"), "parquet": (write_parquet, ".parquet")}
+
+
+def export(user: str, start_day: int, end_day: int, fmt: str, path: str) -> int:
+    """Stream one user's expenses between two day ordinals into path; returns rows written."""
+    write, _ = WRITERS[fmt]
+    return write(ledger.iter_expenses(user, start_day, end_day, EXPORT_CHUNK_ROWS), path)
@@ -2,7 +2,12 @@
 import asyncio
 import json
 import os
-from collections import defaultdict, deque, Counter
+import tempfile
+import time
+import uuid
+import zlib
+from collections import defaultdict, Counter, OrderedDict
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, Any
 
@@ -19,27 +24,146 @@ from telegram.ext import (
 from keyboards import categories_keyboard, confirm_keyboard
 import sheets
 import charts
+import exporter
+import importer
+import ledger
+import metrics
 from utils import parse_amount, now_date_str
+from dayindex import DayIndex, day_ordinal
+from store import ColumnStore, normalize_category
+from budgets import Budgets, OVERALL
 
 # Conversation states
 SELECT_CATEGORY, ENTER_AMOUNT, ENTER_NOTE, CONFIRM = range(4)
 
-# Cache file
+# Process role (see shards.py): "all" does everything in one process; in sharded mode
+# each "shard" serves its users from its own cache, and one "writer" process owns the
+# Sheets writer and reconciler. The SQLite ledger is shared between them.
+ROLE = "all"
+SHARD_INDEX = 0
+SHARD_COUNT = 1
+LEDGER_FOLLOW_INTERVAL = 2.0  # seconds between a shard's checks for rows added by other processes
+
+# Cache file of older versions: read once to seed the cache while the ledger is still empty
 CACHE_FILE = "cache.json"
 
 # Background queue for writes to Google Sheets
 _write_queue: asyncio.Queue | None = None
 _worker_started = False
+WRITE_BATCH_MAX = 1000       # max rows pulled into one flush (a bulk import goes out as one append per month)
+WRITE_BATCH_WINDOW = 2.0     # seconds to keep collecting after the first row
+IMPORT_MAX_FILE_BYTES = 5 * 1024 * 1024  # largest document accepted by the bulk import
+EXPORT_MAX_FILE_BYTES = 50 * 1024 * 1024  # Bot API upload limit for sendDocument
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", "30"))  # seconds to wait for the writer on exit
 
 # Cache structure (in-memory)
+# Aggregates are partitioned by (user, 'YYYY-MM'); a partition is
+#   {"total": float, "days": {'DD/MM/YYYY': amount}, "categories": {'food': amount}}
 _cache_lock = asyncio.Lock()
-_totals_by_day: Dict[str, float] = defaultdict(float)      # 'DD/MM/YYYY' -> amount
-_totals_by_month: Dict[str, float] = defaultdict(float)    # 'YYYY-MM' -> amount
-_totals_by_year: Dict[str, float] = defaultdict(float)     # 'YYYY' -> amount
-_totals_by_category: Dict[str, float] = defaultdict(float) # 'food' -> amount
-_recent = deque(maxlen=200)                                # most recent entries
-_processed_tx_ids = set()                                  # optional dedupe if needed
-# We will not rely on any DB id; keep for future use.
+_partitions: Dict[tuple, Dict[str, Any]] = {}             # (user, 'YYYY-MM') -> partition
+_totals_by_year: Dict[tuple, float] = defaultdict(float)   # (user, 'YYYY') -> amount
+_day_indexes: Dict[str, DayIndex] = {}                     # user -> day ordinal index, for range totals
+_transactions = ColumnStore(normalize_categories=True)     # every individual expense, columnar (append-only)
+_processed_tx_ids: "OrderedDict[str, None]" = OrderedDict()  # recently accepted tx ids (LRU, bounded)
+MAX_TRACKED_TX_IDS = 10000
+
+# Read side: the structures above belong to writers (under _cache_lock). Readers get an
+# immutable, versioned view that is rebuilt copy-on-write (only partitions touched by the
+# batch are copied) and swapped in when the writer releases the lock. Never mutate it.
+# The transaction store is append-only, so the view just records how many rows it covers.
+_view: Dict[str, Any] = {"version": 0, "partitions": {}, "years": {}, "store": _transactions, "rows": 0}
+_dirty_partitions: set = set()                             # partition keys changed since the last publish
+_dirty_all = False                                         # aggregates were cleared/rebuilt
+
+# Reconciliation with Google Sheets (the sheet is the source of truth)
+RECONCILE_INTERVAL = 300.0   # seconds between incremental reconciles
+SHEET_DEFAULT_USER = os.environ.get("SHEET_DEFAULT_USER", "unknown")  # owner of sheet rows with no User cell
+_synced_rows: Dict[str, int] = {}                          # month sheet -> rows already reflected (incl. header)
+_own_writes: Counter = Counter()                           # row keys we appended that the reconciler hasn't seen
+_reconciled = False                                        # a full rebuild has succeeded in this process
+_reconcile_lock = asyncio.Lock()
+_sheet_write_lock = asyncio.Lock()                         # held by the writer per batch, and by a full rebuild
+
+# Ledger state
+_ledger_seen = 0                                           # last ledger id reflected in the cache
+_ledger_generation = 0
+_ledger_fed = 0                                            # writer role: last ledger id queued for Sheets
+
+# Budgets: limits in budgets.Budgets (stored in the ledger), spend from the partitions
+BUDGET_ALERT_DELAY = 2.0     # seconds alerts are collected before sending (one message per user)
+_budgets = Budgets()
+_pending_alerts: Dict[str, list] = defaultdict(list)      # user -> alert lines not sent yet
+_alert_flush_scheduled = False
+_application = None                                        # set by warm_up; sends the alerts
+
+
+def shard_of(user: str, count: int) -> int:
+    """Stable shard for a user key (same in every process)."""
+    return zlib.crc32(user.encode("utf-8")) % count if count > 1 else 0
+
+
+def owns_user(user: str) -> bool:
+    """Whether this process keeps the user's aggregates (shards: only their own users)."""
+    return ROLE != "shard" or shard_of(user, SHARD_COUNT) == SHARD_INDEX
+
+
+def configure_shard(role: str, index: int = 0, count: int = 1):
+    """Set this process's role before warm_up."""
+    global ROLE, SHARD_INDEX, SHARD_COUNT
+    ROLE, SHARD_INDEX, SHARD_COUNT = role, index, count
+
+
+@asynccontextmanager
+async def _cache_locked():
+    """`async with _cache_lock` for writers: records the wait and publishes a new read view on the way out."""
+    t = time.perf_counter()
+    async with _cache_lock:
+        metrics.CACHE_LOCK_WAIT.observe(time.perf_counter() - t)
+        try:
+            yield
+        finally:
+            if _dirty_all or _dirty_partitions:
+                _publish_view()
+
+
+def _frozen_partition(part: Dict[str, Any]) -> Dict[str, Any]:
+    return {"total": part["total"], "days": dict(part["days"]), "categories": dict(part["categories"])}
+
+
+def _publish_view():
+    """Swap in a new read view reflecting the write-side aggregates. Called within cache lock.
+
+    The view is keyed by user: only the month maps of users touched since the last publish
+    are copied; every other user's map is shared with the old view.
+    """
+    global _view, _dirty_all
+    if _dirty_all:
+        parts: Dict[str, dict] = {}
+        for (user, month_k), part in _partitions.items():
+            parts.setdefault(user, {})[month_k] = _frozen_partition(part)
+        years: Dict[str, dict] = {}
+        for (user, year), total in _totals_by_year.items():
+            years.setdefault(user, {})[year] = total
+    else:
+        parts = dict(_view["partitions"])
+        years = dict(_view["years"])
+        copied = set()
+        for user, month_k in _dirty_partitions:
+            if user not in copied:
+                copied.add(user)
+                parts[user] = dict(parts.get(user, ()))
+                years[user] = dict(years.get(user, ()))
+            parts[user][month_k] = _frozen_partition(_partitions[(user, month_k)])
+            years[user][month_k[:4]] = _totals_by_year[(user, month_k[:4])]
+    _dirty_partitions.clear()
+    _dirty_all = False
+    _view = {
+        "version": _view["version"] + 1,
+        "partitions": parts,   # user -> {'YYYY-MM': partition}
+        "years": years,        # user -> {'YYYY': total}
+        "store": _transactions,
+        "rows": len(_transactions),
+    }
 
 
 def _date_to_month_key(date_s: str) -> str:
@@ -51,106 +175,335 @@ def _date_to_month_key(date_s: str) -> str:
     return dt.strftime("%Y-%m")
 
 
-def _date_to_year_key(date_s: str) -> str:
+def _user_key(username, user_id=None) -> str:
+    """Partition key for a user: the username written to Sheets, else the numeric id."""
+    if username:
+        return str(username)
+    if user_id is not None:
+        return str(user_id)
+    return "unknown"
+
+
+def _new_partition() -> Dict[str, Any]:
+    return {"total": 0.0, "days": {}, "categories": {}}
+
+
+def _get_partition(user: str, month_k: str) -> Dict[str, Any] | None:
+    """Single lookup in the current read view; None if the user has nothing that month."""
+    months = _view["partitions"].get(user)
+    return months.get(month_k) if months else None
+
+
+def _day_index_for(user: str) -> DayIndex:
+    idx = _day_indexes.get(user)
+    if idx is None:
+        idx = _day_indexes[user] = DayIndex()
+    return idx
+
+
+def _clear_aggregates():
+    global _dirty_all, _transactions
+    _dirty_all = True
+    _transactions = ColumnStore(normalize_categories=True)  # a new store: views published before keep the old one
+    _dirty_partitions.clear()
+    _partitions.clear()
+    _totals_by_year.clear()
+    _day_indexes.clear()
+
+
+def _add_to_partition(user: str, date_s: str, category: str, amount: float) -> int:
+    """Apply one amount to the user's month partition plus the year and day-index rollups; returns the day ordinal."""
+    category = normalize_category(category)  # sheet rows typed by hand may say "Coffee"
     try:
         dt = datetime.strptime(date_s, "%d/%m/%Y")
     except Exception:
         dt = datetime.now()
-    return dt.strftime("%Y")
-
+    key = (user, dt.strftime("%Y-%m"))
+    part = _partitions.get(key)
+    if part is None:
+        part = _partitions[key] = _new_partition()
+    _dirty_partitions.add(key)
+    part["total"] += amount
+    part["days"][date_s] = part["days"].get(date_s, 0.0) + amount
+    part["categories"][category] = part["categories"].get(category, 0.0) + amount
+    _totals_by_year[(user, dt.strftime("%Y"))] += amount
+    _day_index_for(user).add(dt.toordinal(), amount)
+    return dt.toordinal()
+
+
+def _load_partitions_json(users: dict):
+    """Rebuild partitions and derived rollups from a cache.json snapshot. Called within cache lock."""
+    for user, months in users.items():
+        for month_k, part in months.items():
+            categories = {k: float(v) for k, v in part.get("categories", {}).items()}
+            days = {k: float(v) for k, v in part.get("days", {}).items()}
+            _partitions[(user, month_k)] = {
+                "total": float(part.get("total", sum(days.values()))),
+                "days": days,
+                "categories": categories,
+            }
+            _totals_by_year[(user, month_k[:4])] += _partitions[(user, month_k)]["total"]
+            idx = _day_index_for(user)
+            for day_k, amt in days.items():
+                try:
+                    idx.add(day_ordinal(day_k), amt)
+                except ValueError:
+                    continue
 
-async def _save_cache_to_disk():
-    """Persist the aggregates and recent list to disk (non-blocking)."""
-    # We intentionally only store aggregates to keep file small.
-    async with _cache_lock:
-        data = {
-            "totals_by_day": dict(_totals_by_day),
-            "totals_by_month": dict(_totals_by_month),
-            "totals_by_year": dict(_totals_by_year),
-            "totals_by_category": dict(_totals_by_category),
-            "recent": list(_recent),
-        }
-    loop = asyncio.get_event_loop()
-    def _write():
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f)
-    await loop.run_in_executor(None, _write)
 
+def _load_legacy_aggregates(data: dict):
+    """Migrate a pre-partition cache.json (global totals). Called within cache lock.
 
-async def _load_cache_from_disk():
-    """Load aggregates if cache file exists."""
+    The old file has no per-user split, so everything goes to the single user seen in
+    "recent" (or "unknown"). Lifetime category totals can only be kept when the file
+    covers one month; otherwise each month's total is filed under "uncategorized".
+    """
+    users = {item.get("username") for item in data.get("recent", []) if item.get("username")}
+    user = users.pop() if len(users) == 1 else "unknown"
+    days = {k: float(v) for k, v in data.get("totals_by_day", {}).items()}
+    months = {_date_to_month_key(k) for k in days}
+    categories = {k: float(v) for k, v in data.get("totals_by_category", {}).items()}
+    single_month = len(months) == 1
+    for day_k, amt in days.items():
+        _add_to_partition(user, day_k, "uncategorized", amt)
+    if single_month and categories:
+        _partitions[(user, months.pop())]["categories"] = categories
+
+
+def _read_cache_file() -> dict:
+    """Blocking: the legacy cache.json, or {} when there is none."""
     if not os.path.exists(CACHE_FILE):
-        return
-    loop = asyncio.get_event_loop()
-
-    def _read():
+        return {}
+    try:
         with open(CACHE_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
+    except Exception:
+        return {}
 
+
+async def _load_cache_from_disk():
+    """Seed the cache from a cache.json left by an older version (aggregates plus recent entries)."""
     try:
-        data = await loop.run_in_executor(None, _read)
+        data = await asyncio.to_thread(_read_cache_file)
     except Exception:
         return
+    if not data:
+        return
 
-    async with _cache_lock:
-        _totals_by_day.clear()
-        _totals_by_day.update({k: float(v) for k, v in data.get("totals_by_day", {}).items()})
-        _totals_by_month.clear()
-        _totals_by_month.update({k: float(v) for k, v in data.get("totals_by_month", {}).items()})
-        _totals_by_year.clear()
-        _totals_by_year.update({k: float(v) for k, v in data.get("totals_by_year", {}).items()})
-        _totals_by_category.clear()
-        _totals_by_category.update({k: float(v) for k, v in data.get("totals_by_category", {}).items()})
-        _recent.clear()
-        for item in data.get("recent", []):
-            _recent.append(item)
+    async with _cache_locked():
+        _clear_aggregates()
+        if "partitions" in data:
+            _load_partitions_json({u: m for u, m in data["partitions"].items() if owns_user(u)})
+        else:
+            _load_legacy_aggregates(data)
+        # recent entries (newest first) seed the transaction store until the sheet rebuild replaces it
+        for item in reversed(data.get("recent", [])):
+            try:
+                _transactions.append(_user_key(item.get("username")), day_ordinal(item["date"]),
+                                     item.get("category", "uncategorized"), float(item["amount"]), item.get("note", ""))
+            except (KeyError, TypeError, ValueError):
+                continue
 
 
 async def _ensure_worker_started():
     global _write_queue, _worker_started
-    if _worker_started:
-        return
+    if _worker_started or ROLE == "shard":
+        return  # shards only append to the ledger; the writer process picks rows up from there
+    _worker_started = True  # set before awaiting so concurrent callers don't replay twice
     if _write_queue is None:
         _write_queue = asyncio.Queue()
+    # replay rows a previous run accepted but never synced
+    try:
+        for item in await ledger.replay():
+            _write_queue.put_nowait(item)
+    except Exception as e:
+        print("[ledger] replay failed:", e)
     # start background task
     asyncio.create_task(_background_writer())
-    _worker_started = True
 
 
-async def _enqueue_row_for_write(row: list):
-    """Add a row to the in-memory queue to be pushed to Sheets by background worker."""
-    await _ensure_worker_started()
-    await _write_queue.put(row)
+async def _enqueue_row_for_write(jid: int, row: list):
+    """Add a ledger row to the in-memory queue to be pushed to Sheets by background worker."""
+    if ROLE == "shard":
+        return
+    if not _worker_started:
+        await _ensure_worker_started()  # its replay queues every unsynced ledger row, this one included
+        return
+    await _write_queue.put((jid, row))
+
+
+async def _feed_once():
+    """Writer role: queue rows the shard processes committed to the shared ledger since the last call."""
+    global _ledger_fed
+    _ledger_fed = max(_ledger_fed, max(ledger.pending_rows(), default=0))
+    for item in await ledger.unsynced_after(_ledger_fed):
+        _write_queue.put_nowait(item)
+        _ledger_fed = item[0]
+
+
+async def _feed_writer_from_ledger():
+    while True:
+        await asyncio.sleep(WRITE_BATCH_WINDOW / 2)
+        try:
+            await _feed_once()
+        except Exception as e:
+            print("[ledger] feed failed:", e)
+
+
+async def _serve_resync_requests():
+    """Writer role: run the full resyncs shards ask for (their /resync), then they reload via the generation."""
+    seen = await ledger.resync_requests()  # startup already rebuilds once
+    while True:
+        await asyncio.sleep(LEDGER_FOLLOW_INTERVAL)
+        try:
+            requested = await ledger.resync_requests()
+            if requested != seen:
+                seen = requested
+                n = await rebuild_cache_from_sheets()
+                print(f"[reconciler] resync requested by a shard: rebuilt from {n} sheet rows")
+        except Exception as e:
+            print("[reconciler] requested resync failed:", e)
+
+
+async def _follow_ledger():
+    """Shard role: apply rows other processes put in the ledger for our users (hand-added sheet rows)."""
+    global _ledger_seen, _ledger_generation
+    while True:
+        await asyncio.sleep(LEDGER_FOLLOW_INTERVAL)
+        try:
+            gen = await ledger.generation()
+            if gen != _ledger_generation:
+                # a full resync replaced the synced rows: reload our users from the ledger
+                _ledger_generation = gen
+                await _materialize_from_ledger()
+                continue
+            rows = await ledger.rows_after(_ledger_seen)
+            if rows:
+                async with _cache_locked():
+                    for lid, tx_id, user, day, date_s, category, amount, note in rows:
+                        # our own adds are already in the cache (their tx ids are remembered)
+                        if owns_user(user) and not (tx_id and tx_id in _processed_tx_ids):
+                            _add_to_partition(user, date_s, category, float(amount))
+                            _transactions.append(user, day, category, float(amount), note or "")
+                _ledger_seen = rows[-1][0]
+            await ledger.forget_synced()
+        except Exception as e:
+            print("[ledger] follow failed:", e)
+
+
+async def _collect_batch() -> list:
+    """Wait for the first queued row, then drain more until the batch is full or the window closes."""
+    batch = [await _write_queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + WRITE_BATCH_WINDOW
+    while len(batch) < WRITE_BATCH_MAX:
+        # take whatever is already queued without waiting
+        try:
+            batch.append(_write_queue.get_nowait())
+            continue
+        except asyncio.QueueEmpty:
+            pass
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(_write_queue.get(), timeout=remaining))
+        except asyncio.TimeoutError:
+            break
+    # a row can be queued twice (by the startup replay and by the add that started the writer)
+    return list({jid: (jid, row) for jid, row in batch}.values())
+
+
+def _tx_id_of(row: list):
+    return row[5] if len(row) > 5 and row[5] else None
+
+
+async def _drop_already_written(month: str, rows: list) -> list:
+    """Before a retry: remove rows whose tx id is already in the sheet's tail (the failed call may have landed)."""
+    tx_ids = [t for t in (_tx_id_of(row) for row in rows) if t]
+    if not tx_ids:
+        return rows
+    try:
+        present = await sheets.run(sheets.find_tx_ids, month, tx_ids)
+    except Exception as e:
+        print(f"[background_writer] {month}: tx id check failed: {e}")
+        return rows
+    if present:
+        print(f"[background_writer] {month}: {len(present)} rows already in sheet, not re-appending")
+    return [row for row in rows if _tx_id_of(row) not in present]
+
+
+async def _flush_month_batch(month: str, items: list) -> bool:
+    """Write one month's rows with a single bulk append; retry the whole batch with backoff.
+
+    Retries are idempotent: rows carry a transaction id, and before each retry the
+    sheet's tail is checked so rows from a timed-out-but-applied append aren't duplicated.
+    """
+    rows = [row for _, row in items]
+    attempt = 0
+    max_attempts = 5
+    backoff = 1.0
+    while attempt < max_attempts:
+        attempt += 1
+        try:
+            if attempt > 1:
+                rows = await _drop_already_written(month, rows)
+            if not rows:
+                break
+            # sheets.append_rows_to_month is blocking; run in thread
+            await sheets.run(sheets.append_rows_to_month, month, rows)
+        except Exception as e:
+            if sheets.is_quota_error(e):
+                # not a real failure: the write bucket is now holding back, wait it out
+                # without spending an attempt
+                attempt -= 1
+                metrics.WRITER_RETRIES.labels(reason="quota").inc()
+                wait = sheets.write_limiter.wait_time()
+                print(f"[background_writer] {month}: quota exhausted, pausing {wait:.0f}s")
+                await asyncio.sleep(wait)
+                continue
+            # log and retry with exponential backoff
+            # (don't crash the loop)
+            print(f"[background_writer] {month}: batch of {len(rows)} attempt {attempt} failed: {e}")
+            metrics.WRITER_RETRIES.labels(reason="error").inc()
+            await asyncio.sleep(backoff)
+            backoff *= 2
+            continue
+        break
+    else:
+        return False
+    metrics.WRITER_ROWS.inc(len(items))
+    # synced: the reconciler will see these rows in the sheet, don't count them twice
+    _own_writes.update(_row_key(row) for _, row in items)
+    # ...and they no longer need replaying after a restart
+    try:
+        await ledger.commit([jid for jid, _ in items])
+    except Exception as e:
+        print(f"[ledger] commit failed: {e}")
+    return True
+
 
 
 async def _background_writer():
-    """Background loop that flushes write queue to Google Sheets."""
-    # simple retry/backoff behavior per-row
+    """Background loop that flushes write queue to Google Sheets in batches."""
     while True:
         try:
-            row = await _write_queue.get()
-            success = False
-            attempt = 0
-            max_attempts = 5
-            backoff = 1.0
-            while not success and attempt < max_attempts:
-                attempt += 1
-                try:
-                    # sheets.append_transaction is blocking; run in thread
-                    await asyncio.to_thread(sheets.append_transaction, row)
-                    success = True
-                except Exception as e:
-                    # log and retry with exponential backoff
-                    # (don't crash the loop)
-                    print(f"[background_writer] attempt {attempt} failed: {e}")
-                    await asyncio.sleep(backoff)
-                    backoff *= 2
-            if not success:
-                # final fallback: requeue at the end (so we don't lose it),
-                # and also persist to local cache file so it's safe.
-                print("[background_writer] failed to sync row after retries, re-queuing and saving cache.")
-                await _write_queue.put(row)
-                await _save_cache_to_disk()
+            batch = await _collect_batch()
+            groups: Dict[str, list] = {}
+            for item in batch:
+                groups.setdefault(sheets.month_for_row(item[1]), []).append(item)
+            failed = []
+            for month, items in groups.items():
+                async with _sheet_write_lock:  # a full rebuild must not see rows go synced mid-read
+                    ok = await _flush_month_batch(month, items)
+                if not ok:
+                    failed.extend(items)
+            if failed:
+                # final fallback: requeue at the end (they stay unsynced in the ledger,
+                # so a restart replays them too)
+                print(f"[background_writer] failed to sync {len(failed)} rows after retries, re-queuing.")
+                for item in failed:
+                    await _write_queue.put(item)
                 # wait longer before continuing to avoid hot loop
                 await asyncio.sleep(10)
         except Exception as e:
@@ -161,40 +514,397 @@ async def _background_writer():
 def _add_expense_to_cache(date_s: str, category: str, amount: float, note: str, username: str):
     """Synchronous helper to update in-memory aggregates. Called within cache lock."""
     # date_s expected "DD/MM/YYYY"
-    _totals_by_day[date_s] = _totals_by_day.get(date_s, 0.0) + float(amount)
-    month_k = _date_to_month_key(date_s)
-    _totals_by_month[month_k] = _totals_by_month.get(month_k, 0.0) + float(amount)
-    year_k = _date_to_year_key(date_s)
-    _totals_by_year[year_k] = _totals_by_year.get(year_k, 0.0) + float(amount)
-    _totals_by_category[category] = _totals_by_category.get(category, 0.0) + float(amount)
-    # recent entry
-    _recent.appendleft({
-        "date": date_s,
-        "category": category,
-        "amount": float(amount),
-        "note": note,
-        "username": username,
-    })
-
-
-async def add_expense(date_s: str, category: str, amount: float, note: str, username: str):
-    """Public: update cache, persist cache file periodically, and enqueue write to Sheets."""
-    # 1) update in-memory quickly
-    async with _cache_lock:
+    user = _user_key(username)
+    category = normalize_category(category)
+    watched = _budgets.watches(user)
+    if watched:
+        # month and category spend before this expense, to see which thresholds it crosses
+        key = (user, _date_to_month_key(date_s))
+        part = _partitions.get(key)
+        before_total = part["total"] if part else 0.0
+        before_cat = part["categories"].get(category, 0.0) if part else 0.0
+    day = _add_to_partition(user, date_s, category, float(amount))
+    _transactions.append(user, day, category, float(amount), note or "")
+    if watched:
+        part = _partitions[key]
+        _check_budget(user, key[1], OVERALL, before_total, part["total"])
+        _check_budget(user, key[1], category, before_cat, part["categories"][category])
+
+
+def _check_budget(user: str, month_k: str, scope: str, before: float, after: float):
+    """Queue an alert if the spend just moved past a threshold of the (user, scope) budget (the highest one)."""
+    crossed = _budgets.crossed(user, scope, before, after)
+    if not crossed:
+        return
+    level, limit = crossed[-1]
+    month = datetime.strptime(month_k, "%Y-%m").strftime("%B %Y")
+    name = "Total" if scope == OVERALL else scope
+    icon = "🚨" if level >= 1.0 else "⚠️"
+    _pending_alerts[user].append(
+        f"{icon} {name}: ₹{after:.2f} of ₹{limit:.2f} ({after / limit:.0%}) in {month}")
+    _schedule_alerts()
+
+
+def _schedule_alerts():
+    """Send pending alerts after BUDGET_ALERT_DELAY, so a burst (or an import) makes one message per user."""
+    global _alert_flush_scheduled
+    if _alert_flush_scheduled or _application is None:
+        return
+    _alert_flush_scheduled = True
+    job_queue = getattr(_application, "job_queue", None)
+    if job_queue is not None:
+        job_queue.run_once(_budget_alert_job, BUDGET_ALERT_DELAY, name="budget-alerts")
+    else:
+        # no job queue (python-telegram-bot installed without the job-queue extra)
+        async def later():
+            await asyncio.sleep(BUDGET_ALERT_DELAY)
+            await _send_budget_alerts(_application.bot)
+        asyncio.create_task(later())
+
+
+async def _budget_alert_job(context: ContextTypes.DEFAULT_TYPE):
+    await _send_budget_alerts(context.bot)
+
+
+async def _send_budget_alerts(bot):
+    global _alert_flush_scheduled
+    _alert_flush_scheduled = False
+    pending = dict(_pending_alerts)
+    _pending_alerts.clear()
+    for user, lines in pending.items():
+        chat_id = _budgets.chats.get(user)
+        if chat_id is None:
+            continue
+        try:
+            await bot.send_message(chat_id, "Budget alert:\n" + "\n".join(lines))
+        except Exception as e:
+            print("[budgets] alert not sent:", e)
+
+
+def new_tx_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _remember_tx(tx_id: str) -> bool:
+    """Record a tx id; False if it was already seen recently (duplicate submit)."""
+    if tx_id in _processed_tx_ids:
+        _processed_tx_ids.move_to_end(tx_id)
+        return False
+    _processed_tx_ids[tx_id] = None
+    while len(_processed_tx_ids) > MAX_TRACKED_TX_IDS:
+        _processed_tx_ids.popitem(last=False)
+    return True
+
+
+def _forget_txs(tx_ids):
+    for tx_id in tx_ids:
+        _processed_tx_ids.pop(tx_id, None)
+
+
+async def add_expense(date_s: str, category: str, amount: float, note: str, username: str,
+                      tx_id: str | None = None):
+    """Public: record the row in the ledger, update cache, and enqueue write to Sheets.
+
+    tx_id identifies the expense end to end (it is written as the sheet's TxID column);
+    submitting the same tx_id twice is a no-op. Returns the tx id.
+    """
+    tx_id = tx_id or new_tx_id()
+    if not _remember_tx(tx_id):
+        return tx_id
+    row = [date_s, category, f"{float(amount):.2f}", note or "", username or "", tx_id]
+    # 1) durable first: the ledger commits in groups, so concurrent confirms share one fsync
+    try:
+        jid = await ledger.append(row)
+    except Exception:
+        _forget_txs([tx_id])
+        raise
+    if not jid:
+        return tx_id  # tx id already in the ledger
+    metrics.EXPENSES_ADDED.inc()
+    # 2) update in-memory quickly
+    async with _cache_locked():
         _add_expense_to_cache(date_s, category, amount, note, username)
-    # 2) persist cache to disk in background (do not await long in caller)
-    asyncio.create_task(_save_cache_to_disk())
     # 3) enqueue row for Sheets
-    row = [date_s, category, f"{float(amount):.2f}", note or "", username or ""]
-    await _enqueue_row_for_write(row)
+    await _enqueue_row_for_write(jid, row)
+    return tx_id
+
+
+async def add_expenses_bulk(expenses: list, username: str) -> int:
+    """Public: record many expenses at once: one ledger transaction, one cache update, one queue push.
+
+    expenses are dicts with date, category, amount, note and tx_id; already-seen tx ids
+    are skipped. Returns the set of tx ids that were new.
+    """
+    rows = [[e["date"], e["category"], f"{float(e['amount']):.2f}", e.get("note") or "", username or "", e["tx_id"]]
+            for e in expenses if _remember_tx(e["tx_id"])]
+    try:
+        ids = await ledger.append_many(rows)
+    except Exception:
+        _forget_txs(row[5] for row in rows)  # not recorded: a retry must not be taken for a duplicate
+        raise
+    added = [(jid, row) for jid, row in zip(ids, rows) if jid]
+    if not added:
+        return set()
+    metrics.EXPENSES_ADDED.inc(len(added))
+    async with _cache_locked():
+        for _, row in added:
+            _add_expense_to_cache(row[0], row[1], float(row[2]), row[3], username)
+    # all at once, so the background writer picks them up as a single batch
+    if ROLE != "shard":
+        await _ensure_worker_started()
+        for item in added:
+            _write_queue.put_nowait(item)
+    return {row[5] for _, row in added}
+
+
+def _row_key(row: list) -> tuple:
+    """Comparable form of a sheet row: first five cells as strings, trailing blanks dropped."""
+    key = [str(c) for c in list(row)[:5]]
+    while key and key[-1] == "":
+        key.pop()
+    return tuple(key)
+
+
+def _is_data_row(row: list) -> bool:
+    return bool(row) and row[0] != sheets.HEADER[0]
+
+
+def _apply_sheet_row(row: list) -> list | None:
+    """Add a raw sheet row [date, category, amount, notes, user] to the aggregates. Called within cache lock.
+
+    Returns the row with blank user filled in (as stored in the ledger), or None if it isn't an expense.
+    """
+    if not _is_data_row(row):
+        return None
+    row = list(row) + [""] * (5 - len(row))
+    date_s, category, amount_s, note, username = row[:5]
+    try:
+        amount = float(amount_s)
+    except (TypeError, ValueError):
+        try:
+            amount = parse_amount(str(amount_s))
+        except ValueError:
+            return None
+    # rows typed into the sheet by hand usually have no user column
+    row[4] = username or SHEET_DEFAULT_USER
+    user = _user_key(row[4])
+    if not owns_user(user):
+        return row  # another shard's user: only the ledger needs it
+    day = _add_to_partition(user, date_s, category or "uncategorized", amount)
+    _transactions.append(user, day, category or "uncategorized", amount, note or "")
+    return row
+
+
+async def rebuild_cache_from_sheets() -> int:
+    """Full rebuild: read every month sheet in one batched request and replace the aggregates.
+
+    The Sheets writer is held off for the duration, so no row can become synced between the
+    read and the ledger update; rows still waiting to be written are re-applied on top.
+    Returns the number of sheet rows applied.
+    """
+    global _reconciled
+    async with _reconcile_lock, _sheet_write_lock:
+        months = await sheets.run(sheets.list_month_sheets)
+        data = await sheets.run(sheets.batch_read_rows, {m: 1 for m in months})
+        pending = ledger.pending_rows()
+
+        sheet_rows = []
+        async with _cache_locked():
+            _clear_aggregates()
+            for rows in data.values():
+                for row in rows:
+                    row = _apply_sheet_row(row)
+                    if row is not None:
+                        sheet_rows.append(row)
+            for row in pending.values():
+                _apply_sheet_row(row)
+            _synced_rows.clear()
+            _synced_rows.update({m: len(rows) for m, rows in data.items()})
+            _own_writes.clear()
+        # the sheet is authoritative for everything already synced
+        await ledger.replace_synced(sheet_rows, dict(_synced_rows))
+        _reconciled = True
+    return len(sheet_rows)
+
+
+async def reconcile_incremental() -> int:
+    """Fetch only rows appended since the last sync (one ranged batch read) and apply the ones we didn't write."""
+    async with _reconcile_lock:
+        months = await sheets.run(sheets.list_month_sheets)
+        start_rows = {m: _synced_rows.get(m, 0) + 1 for m in months}
+        data = await sheets.run(sheets.batch_read_rows, start_rows)
+        # rows carrying a tx id the ledger already has were written by the bot (maybe by an
+        # earlier run, before a restart emptied _own_writes)
+        known = await ledger.known_tx_ids([t for rows in data.values() for t in map(_tx_id_of, rows) if t])
+        applied = []
+        async with _cache_locked():
+            for month, rows in data.items():
+                for row in rows:
+                    key = _row_key(row)
+                    if _own_writes[key] > 0:
+                        _own_writes[key] -= 1
+                        if not _own_writes[key]:
+                            del _own_writes[key]
+                        continue
+                    if _tx_id_of(row) in known:
+                        continue
+                    row = _apply_sheet_row(row)
+                    if row is not None:
+                        applied.append(row)
+                _synced_rows[month] = _synced_rows.get(month, 0) + len(rows)
+        await ledger.add_synced(applied, {m: _synced_rows[m] for m, rows in data.items() if rows})
+    return len(applied)
+
+
+async def _resume_reconcile():
+    """Pick up the sheet row counts stored by the last reconcile, so a restart starts incremental."""
+    global _reconciled
+    counts = await ledger.sheet_rows()
+    if counts:
+        _synced_rows.update(counts)
+        _reconciled = True
+
+
+async def _reconciler():
+    """Background loop: a full rebuild on the first run (or after /resync), then incremental passes every RECONCILE_INTERVAL."""
+    while True:
+        try:
+            if not _reconciled:
+                n = await rebuild_cache_from_sheets()
+                print(f"[reconciler] rebuilt cache from {n} sheet rows")
+            else:
+                n = await reconcile_incremental()
+                if n:
+                    print(f"[reconciler] applied {n} rows added outside the bot")
+        except Exception as e:
+            print("[reconciler] failed:", e)
+        await asyncio.sleep(RECONCILE_INTERVAL)
+
+
+async def _keep_sheets_client():
+    """Background loop: authenticate with Sheets at startup, then renew the token before it expires."""
+    while True:
+        try:
+            await sheets.run(sheets.connect)
+            ttl = await sheets.run(sheets.refresh_token)
+            delay = max(30.0, ttl - sheets.TOKEN_REFRESH_AHEAD)
+        except Exception as e:
+            print("[sheets] client setup/refresh failed:", e)
+            delay = 30.0
+        await asyncio.sleep(delay)
+
+
+async def _materialize_from_ledger() -> bool:
+    """Rebuild the in-memory aggregates as a view over the ledger; False if the ledger is empty."""
+    global _transactions, _ledger_seen
+    store, last_id = await ledger.load_store(owns_user if ROLE == "shard" else None)
+    _ledger_seen = last_id
+    if not len(store):
+        return False
+    # partitions are rebuilt from per-(user, day, category) sums, one vectorized group-by
+    totals = store.group_by("user", "day", "category")
+    async with _cache_locked():
+        _clear_aggregates()
+        _transactions = store
+        for (user, day, category), amount in totals.items():
+            _add_to_partition(user, datetime.fromordinal(day).strftime("%d/%m/%Y"), category, amount)
+    return True
+
+
+async def _load_budgets(application):
+    """Budgets of the users this process serves; alerts go out through the application's bot."""
+    global _application
+    _application = application
+    try:
+        rows = await ledger.load_budgets()
+    except Exception as e:
+        print("[budgets] load failed:", e)
+        return
+    _budgets.clear()
+    for user, scope, amount, chat_id in rows:
+        if owns_user(user):
+            _budgets.set(user, scope, amount, chat_id)
+
+
+def _register_gauges():
+    metrics.WRITE_QUEUE_DEPTH.set_function(lambda: _write_queue.qsize() if _write_queue else 0)
+    metrics.OLDEST_UNSYNCED_AGE.set_function(ledger.oldest_pending_age)
+    metrics.SHEETS_BUDGET.set_function(lambda: {
+        (("bucket", k),): v["tokens"] for k, v in sheets.rate_budget().items()})
+    metrics.SHEETS_WAIT.set_function(lambda: {
+        (("bucket", k),): v["wait_seconds"] for k, v in sheets.rate_budget().items()})
+
+
+async def drain_writes(timeout: float) -> int:
+    """Wait until the background writer has pushed every accepted row; returns rows still pending."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while _worker_started and ledger.pending_rows() and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+    return len(ledger.pending_rows())
+
+
+async def shutdown(application):
+    """Shutdown hook (ApplicationBuilder.post_shutdown): drain Sheets writes, stop the chart pool."""
+    if ROLE == "writer":
+        try:
+            await _feed_once()  # rows the shards added just before they stopped
+        except Exception as e:
+            print("[ledger] feed failed:", e)
+    left = await drain_writes(SHUTDOWN_DRAIN_TIMEOUT) if ROLE != "shard" else 0
+    if left:
+        print(f"[shutdown] {left} rows not yet in Sheets; they stay in the ledger and are replayed on next start")
+    charts.shutdown_pool()
+
+
+async def warm_up(application, start_charts: bool = True):
+    """Startup hook (ApplicationBuilder.post_init): load the cache once and start the writer.
+
+    start_charts=False skips the chart process pool (front ends without /chart).
+    """
+    global _ledger_generation
+    # the ledger is the source of truth; cache.json only covers the first run after an upgrade
+    try:
+        _ledger_generation = await ledger.generation()
+        loaded = await _materialize_from_ledger()
+    except Exception as e:
+        print("[ledger] materialize failed:", e)
+        loaded = False
+    if not loaded:
+        await _load_cache_from_disk()
+    if ROLE != "shard":
+        asyncio.create_task(_keep_sheets_client())  # shards leave Sheets to the writer process
+    if ROLE != "writer":
+        await _load_budgets(application)
+    if ROLE == "shard":
+        asyncio.create_task(_follow_ledger())
+    else:
+        await _ensure_worker_started()
+        if ROLE == "writer":
+            asyncio.create_task(_feed_writer_from_ledger())
+            asyncio.create_task(_serve_resync_requests())
+        try:
+            await _resume_reconcile()
+        except Exception as e:
+            print("[reconciler] stored sheet row counts not loaded:", e)
+        asyncio.create_task(_reconciler())
+    if start_charts and ROLE != "writer":
+        charts.start_pool()
+    _register_gauges()
+    port = metrics.METRICS_PORT
+    if port and ROLE == "shard":
+        port += SHARD_INDEX + 1  # writer on METRICS_PORT, shard i on METRICS_PORT + 1 + i
+    try:
+        await metrics.start_http_server(port=port)
+    except OSError as e:
+        print("[metrics] endpoint not started:", e)
 
 
 # ----------------- Telegram conversation handlers -----------------
 
 # Entry: /start
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # lazy-load existing cache file once on first call
-    await _load_cache_from_disk()
+    # cache and writer are set up once by warm_up(); this is a no-op after startup
     await _ensure_worker_started()
 
     user = update.effective_user
@@ -224,7 +934,8 @@ async def category_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Accept free-text category (when user typed instead of pressing)
 async def category_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text.strip()
+    # stored the way imports and budgets spell it ("Coffee " -> "coffee")
+    text = normalize_category(update.message.text)
     context.user_data.setdefault("txn", {})["category"] = text
     await update.message.reply_text(f"Category set to: {text}\nNow enter amount (e.g. 199):")
     return ENTER_AMOUNT
@@ -258,7 +969,9 @@ async def note_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Internal: ask confirm with summary
 async def _ask_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    txn = context.user_data.get("txn", {})
+    txn = context.user_data.setdefault("txn", {})
+    # stable id for this expense: a repeated confirm (or a retried write) won't record it twice
+    txn.setdefault("tx_id", new_tx_id())
     date = now_date_str()  # returns "DD/MM/YYYY"
     user = context.user_data.get("user", {})
     cat = txn.get("category", "uncategorized")
@@ -296,12 +1009,13 @@ async def confirm_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     category = txn.get("category", "uncategorized")
     amount = float(txn.get("amount", 0))
     note = txn.get("note", "")
-    username = str(context.user_data.get("user", {}).get("username", "unknown"))
+    user = context.user_data.get("user", {})
+    username = _user_key(user.get("username"), user.get("id"))
 
     # update cache + queue (async)
     try:
         # fast update + background write
-        await add_expense(date, category, amount, note, username)
+        await add_expense(date, category, amount, note, username, tx_id=txn.get("tx_id"))
     except Exception as e:
         # If something goes wrong updating cache/queue, inform user
         await query.edit_message_text(f"❌ Failed to record locally: {e}")
@@ -322,12 +1036,14 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # Stats handler (for commands: /today /month /summary)
 async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # All stats are served from in-memory cache (fast, O(1))
+    # All stats are served from the caller's (user, month) partition in the current read
+    # view (fast, O(1)); the view is immutable, so reads never wait on _cache_lock.
     text = update.message.text.strip().lower()
+    user = _user_key(update.effective_user.username, update.effective_user.id)
     if text.startswith("/today"):
         date = now_date_str()  # 'DD/MM/YYYY'
-        async with _cache_lock:
-            total = _totals_by_day.get(date, 0.0)
+        part = _get_partition(user, _date_to_month_key(date))
+        total = part["days"].get(date, 0.0) if part else 0.0
         await update.message.reply_text(f"Today's total: ₹{total:.2f}")
         return
 
@@ -335,9 +1051,9 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # default: current month
         now = datetime.now()
         key = now.strftime("%Y-%m")
-        async with _cache_lock:
-            agg = dict(_totals_by_category)
-            month_total = _totals_by_month.get(key, 0.0)
+        part = _get_partition(user, key)
+        agg = part["categories"] if part else {}
+        month_total = part["total"] if part else 0.0
         # build response
         lines = [f"{k}: ₹{v:.2f}" for k, v in agg.items()]
         msg = "This month's spend (per category - from cache):\n" + "\n".join(lines) + f"\n\nTotal: ₹{month_total:.2f}"
@@ -345,31 +1061,33 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     if text.startswith("/summary"):
-        # usage: /summary DD/MM/YYYY:DD/MM/YYYY  -> fallback: if omitted, show month
+        # usage: /summary DD/MM/YYYY:DD/MM/YYYY [category]  -> fallback: if omitted, show month
         parts = text.split()
         if len(parts) < 2:
             # fallback to month summary
             now = datetime.now()
             month_key = now.strftime("%Y-%m")
-            async with _cache_lock:
-                month_total = _totals_by_month.get(month_key, 0.0)
+            part = _get_partition(user, month_key)
+            month_total = part["total"] if part else 0.0
             await update.message.reply_text(f"Month ({month_key}) total: ₹{month_total:.2f}")
             return
         rng = parts[1]
         try:
             start_s, end_s = rng.split(":")
-            s_dt = datetime.strptime(start_s, "%d/%m/%Y")
-            e_dt = datetime.strptime(end_s, "%d/%m/%Y")
-            # We'll iterate through cached daily totals within range (cheap)
-            total = 0.0
-            async with _cache_lock:
-                for day_k, amt in _totals_by_day.items():
-                    try:
-                        d = datetime.strptime(day_k, "%d/%m/%Y")
-                        if s_dt <= d <= e_dt:
-                            total += amt
-                    except Exception:
-                        continue
+            s_ord = day_ordinal(start_s)
+            e_ord = day_ordinal(end_s)
+            # O(log n) lookup in the day index; a synchronous read, so no lock is needed
+            if len(parts) > 2:
+                # category within a range: not pre-aggregated, a vectorized filter over the transaction store
+                category = normalize_category(" ".join(parts[2:]))
+                view = _view
+                total, count = view["store"].total(n=view["rows"], user=user, category=category,
+                                                   start_day=s_ord, end_day=e_ord)
+                await update.message.reply_text(
+                    f"Summary {start_s} to {end_s} ({category}):\nTotal: ₹{total:.2f} over {count} expenses")
+                return
+            idx = _day_indexes.get(user)
+            total = idx.range_total(s_ord, e_ord) if idx else 0.0
             await update.message.reply_text(f"Summary {start_s} to {end_s}:\nTotal: ₹{total:.2f}")
         except Exception:
             await update.message.reply_text("Could not parse range. Use DD/MM/YYYY:DD/MM/YYYY")
@@ -378,47 +1096,293 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Unknown stats command. Use /today, /month or /summary DD/MM/YYYY:DD/MM/YYYY")
 
 
-# Chart handler: /chart [pie|bar] (reads from cache)
+# /year [YYYY] [sheet]: month-by-month totals for a year (from the read view, or straight from Sheets)
+async def year_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = [a.lower() for a in (context.args or [])]
+    from_sheet = "sheet" in args
+    args = [a for a in args if a != "sheet"]
+    try:
+        year = int(args[0]) if args else datetime.now().year
+    except ValueError:
+        await update.message.reply_text("Usage: /year [YYYY] [sheet]")
+        return
+    user = _user_key(update.effective_user.username, update.effective_user.id)
+
+    months = []  # (label, total, {category: amount})
+    if from_sheet:
+        # all twelve month sheets in one batched read
+        try:
+            data = await sheets.run(sheets.aggregate_year, year, user, SHEET_DEFAULT_USER)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Could not read Google Sheets: {e}")
+            return
+        for title, cats in data.items():
+            months.append((title.split()[0], sum(cats.values()), cats))
+    else:
+        for m, part in _user_partitions(user):
+            if m.startswith(f"{year}-"):
+                label = datetime.strptime(m, "%Y-%m").strftime("%B")
+                months.append((label, part["total"], part["categories"]))
+
+    if not months:
+        await update.message.reply_text(f"No expenses recorded in {year}.")
+        return
+    categories: Dict[str, float] = defaultdict(float)
+    for _, _, cats in months:
+        for k, v in cats.items():
+            categories[k] += v
+    total = sum(t for _, t, _ in months)
+    top = sorted(categories.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    lines = [f"{year} spend{' (from Google Sheets)' if from_sheet else ''}:"]
+    lines.extend(f"{label}: ₹{t:.2f}" for label, t, _ in months)
+    lines.append("")
+    lines.append("Top categories: " + ", ".join(f"{k} ₹{v:.2f}" for k, v in top))
+    lines.append(f"Total: ₹{total:.2f}")
+    await update.message.reply_text("\n".join(lines))
+
+
+def _user_partitions(user: str, view: Dict[str, Any] | None = None):
+    """(month_key, partition) pairs for one user from a read view, oldest month first."""
+    return sorted((view or _view)["partitions"].get(user, {}).items())
+
+
+# /budget [show] | /budget set [category] <amount>: monthly budgets, alerts at 80% and 100%
+async def budget_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = [a.lower() for a in (context.args or [])]
+    user = _user_key(update.effective_user.username, update.effective_user.id)
+    if args and args[0] == "set":
+        try:
+            amount = parse_amount(args[-1])
+        except (IndexError, ValueError):
+            amount = None
+        if amount is None or len(args) < 2:
+            await update.message.reply_text("Usage: /budget set [category] <amount>  (amount 0 removes it)")
+            return
+        scope = normalize_category(" ".join(args[1:-1])) if len(args) > 2 else OVERALL
+        try:
+            await ledger.set_budget(user, scope, amount, update.effective_chat.id)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Could not save the budget: {e}")
+            return
+        _budgets.set(user, scope, amount, update.effective_chat.id)
+        name = "Monthly" if scope == OVERALL else f"Monthly {scope}"
+        if amount > 0:
+            await update.message.reply_text(f"✅ {name} budget set to ₹{amount:.2f}. You'll be alerted at 80% and 100%.")
+        else:
+            await update.message.reply_text(f"✅ {name} budget removed.")
+        return
+    if args and args[0] != "show":
+        await update.message.reply_text("Usage: /budget [show] or /budget set [category] <amount>")
+        return
+
+    limits = _budgets.limits_for(user)
+    if not limits:
+        await update.message.reply_text("No budgets set. Use /budget set <amount> or /budget set <category> <amount>.")
+        return
+    month_k = datetime.now().strftime("%Y-%m")
+    part = _get_partition(user, month_k)
+    lines = [f"Budgets for {datetime.now().strftime('%B %Y')}:"]
+    for scope, limit in sorted(limits.items(), key=lambda kv: (kv[0] != OVERALL, kv[0])):
+        if scope == OVERALL:
+            spent = part["total"] if part else 0.0
+        else:
+            spent = part["categories"].get(scope, 0.0) if part else 0.0
+        name = "Total" if scope == OVERALL else scope
+        lines.append(f"{name}: ₹{spent:.2f} of ₹{limit:.2f} ({spent / limit:.0%})")
+    await update.message.reply_text("\n".join(lines))
+
+
+# Chart handler: /chart [pie|bar|daily|monthly] (reads from cache)
 async def chart_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip().lower()
-    chart_type = "pie"
-    if "bar" in text:
-        chart_type = "bar"
+    parts = text.split()
+    chart_type = parts[1] if len(parts) > 1 else "pie"
+    if chart_type not in ("pie", "bar", "daily", "monthly"):
+        await update.message.reply_text("Usage: /chart [pie|bar|daily|monthly]")
+        return
 
-    async with _cache_lock:
-        agg = dict(_totals_by_category)
+    user = _user_key(update.effective_user.username, update.effective_user.id)
+    # one read view for the whole chart: new expenses publish a new view, this one stays as is
+    view = _view
+    if chart_type in ("pie", "bar"):
+        part = view["partitions"].get(user, {}).get(datetime.now().strftime("%Y-%m"))
+        agg = part["categories"] if part else {}
+        title = "This month's expenses"
+    elif chart_type == "monthly":
+        months = _user_partitions(user, view)
+        # bucketed here, so the pool gets (and the PNG cache hashes) at most MAX_POINTS points
+        agg = charts.bucket_points([int(m[:4]) * 12 + int(m[5:7]) - 1 for m, _ in months],
+                                   [part["total"] for _, part in months])
+        title = "Monthly spend"
+    else:
+        totals = view["store"].group_by("day", n=view["rows"], user=user)  # day ordinal -> amount
+        agg = charts.bucket_points(list(totals), list(totals.values()))
+        title = "Daily spend"
 
     if not agg:
         await update.message.reply_text("No data yet to build chart.")
         return
 
-    # Create chart in a thread (chart functions use matplotlib but are headless)
+    # Render in the chart process pool; unchanged data is served from the PNG cache
     try:
-        if chart_type == "bar":
-            buf = await asyncio.to_thread(charts.bar_chart_from_dict, agg, "This month's expenses")
-        else:
-            buf = await asyncio.to_thread(charts.pie_chart_from_dict, agg, "This month's expenses")
+        png = await charts.render_chart(chart_type, agg, title)
 
-        if buf is None:
+        if png is None:
             await update.message.reply_text("Failed to create chart.")
             return
 
-        # charts.* returns BytesIO or path; prefer BytesIO -> send as photo
-        if hasattr(buf, "read"):
-            buf.seek(0)
-            await update.message.reply_photo(buf)
-        else:
-            # assume it's a file path
-            with open(buf, "rb") as f:
-                await update.message.reply_photo(f)
-            try:
-                os.remove(buf)
-            except Exception:
-                pass
+        await update.message.reply_photo(png)
     except Exception as e:
         await update.message.reply_text(f"Chart generation failed: {e}")
 
 
+# /resync: rebuild the cache from Google Sheets (picks up rows edited by hand)
+async def resync_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if ROLE == "shard":
+        # only the writer process sees every shard's unsynced rows, so it does the rebuild;
+        # this shard reloads from the ledger when the rebuild bumps its generation
+        try:
+            await ledger.request_resync()
+        except Exception as e:
+            await update.message.reply_text(f"❌ Resync failed: {e}")
+            return
+        await update.message.reply_text("✅ Resync requested; totals reload from Google Sheets in a few seconds.")
+        return
+    await update.message.reply_text("Resyncing from Google Sheets...")
+    try:
+        n = await rebuild_cache_from_sheets()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Resync failed: {e}")
+        return
+    await update.message.reply_text(f"✅ Cache rebuilt from {n} sheet rows.")
+
+
+# /stats_internal: metrics dump for admins (ADMIN_USER_IDS, default USER_ID)
+ADMIN_USER_IDS = {x.strip() for x in os.environ.get("ADMIN_USER_IDS", os.environ.get("USER_ID", "")).split(",") if x.strip()}
+
+
+async def stats_internal_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if str(update.effective_user.id) not in ADMIN_USER_IDS:
+        await update.message.reply_text("Not allowed.")
+        return
+    # skip HELP/TYPE comments and empty histogram buckets to keep it readable in chat
+    lines = [l for l in metrics.render().splitlines()
+             if not l.startswith("#") and not ("_bucket{" in l and 'le="+Inf"' not in l)]
+    text = "\n".join(lines)
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    await update.message.reply_text(text or "No metrics yet.")
+
+
+# Bulk import: "/import" + lines, a multi-line message, or a .csv/.xlsx document
+def _import_tx_id(user: str, source: str, line_no: int) -> str:
+    # deterministic: the same user sending the same message or file again doesn't add its rows
+    # twice (file ids are shared across users, so the user is part of the name)
+    return uuid.uuid5(uuid.NAMESPACE_URL, f"spendbot-import:{user}:{source}:{line_no}").hex
+
+
+async def _run_import(update: Update, records_fn, source: str):
+    user = _user_key(update.effective_user.username, update.effective_user.id)
+    try:
+        result = await asyncio.to_thread(lambda: importer.collect(records_fn(), now_date_str()))
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Import failed: {e}")
+        return
+    except Exception as e:
+        # a malformed csv, or a file that isn't really an .xlsx
+        print(f"[import] {source}: could not read records: {e!r}")
+        await update.message.reply_text("❌ Import failed: the file could not be read.")
+        return
+    expenses = [dict(e, tx_id=_import_tx_id(user, source, line_no)) for line_no, e in result["accepted"]]
+    try:
+        new_ids = await add_expenses_bulk(expenses, user) if expenses else set()
+    except Exception as e:
+        await update.message.reply_text(f"❌ Import failed, nothing was saved: {e}")
+        return
+    added = len(new_ids)
+    total = sum(e["amount"] for e in expenses if e["tx_id"] in new_ids)
+    lines = [f"📥 Imported {added} expenses (₹{total:.2f})."]
+    if len(expenses) > added:
+        lines.append(f"{len(expenses) - added} already imported before, skipped.")
+    if result["rejected"]:
+        lines.append(f"Rejected {result['rejected']} lines:")
+        lines.extend(result["details"])
+        if result["rejected"] > len(result["details"]):
+            lines.append("…")
+    if added:
+        lines.append("Saved locally and will sync to Google Sheets shortly.")
+    await update.message.reply_text("\n".join(lines))
+
+
+async def import_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/import followed by lines, or any multi-line message: one '[date,] category, amount [, note]' per line."""
+    text = update.message.text or ""
+    if text.startswith("/import"):
+        text = text.partition("\n")[2] if "\n" in text else text[len("/import"):]
+    if not text.strip():
+        await update.message.reply_text(
+            "Send one expense per line: [DD/MM/YYYY,] category, amount [, note]\n"
+            "or upload a .csv/.xlsx with date, category, amount, note columns.")
+        return
+    source = f"msg:{update.effective_chat.id}:{update.message.message_id}"
+    await _run_import(update, lambda: importer.text_records(text), source)
+
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    doc = update.message.document
+    if doc.file_size and doc.file_size > IMPORT_MAX_FILE_BYTES:
+        await update.message.reply_text("❌ File too large to import.")
+        return
+    tg_file = await doc.get_file()
+    fd, path = tempfile.mkstemp(prefix="spendbot-import-")
+    os.close(fd)
+    try:
+        await tg_file.download_to_drive(path)
+        await _run_import(update, lambda: importer.records_for_file(path, doc.file_name), f"doc:{doc.file_unique_id}")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# /export [all|YYYY|YYYY-MM|DD/MM/YYYY:DD/MM/YYYY] [csv|parquet]: history from the local ledger as a file
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args or []
+    fmt = "csv"
+    if args and args[-1].lower() in exporter.WRITERS:
+        fmt = args.pop().lower()
+    try:
+        start_day, end_day = exporter.parse_range(args[0] if args else None)
+    except ValueError:
+        await update.message.reply_text(
+            "Usage: /export [all|YYYY|YYYY-MM|DD/MM/YYYY:DD/MM/YYYY] [csv|parquet]")
+        return
+    user = _user_key(update.effective_user.username, update.effective_user.id)
+    suffix = exporter.WRITERS[fmt][1]
+    fd, path = tempfile.mkstemp(prefix="spendbot-export-", suffix=suffix)
+    os.close(fd)
+    try:
+        # the ledger holds every expense (synced or not), read in chunks off the event loop
+        n = await asyncio.to_thread(exporter.export, user, start_day, end_day, fmt, path)
+        if not n:
+            await update.message.reply_text("No expenses in that range.")
+            return
+        if os.path.getsize(path) > EXPORT_MAX_FILE_BYTES:
+            await update.message.reply_text("❌ Export is too large to send; try a shorter range.")
+            return
+        name = f"expenses-{(args[0] if args else 'all').replace('/', '-').replace(':', '_')}{suffix}"
+        with open(path, "rb") as f:
+            await update.message.reply_document(f, filename=name, caption=f"{n} expenses")
+    except ValueError as e:
+        await update.message.reply_text(f"❌ Export failed: {e}")
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
 # Message fallback to guide user while in conversation
 async def fallback_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("I didn't understand that. Use /start to add an expense or /today /month /chart.")
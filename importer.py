@@ -0,0 +1,169 @@
+# importer.py — parse bulk expense lines from a text message, CSV or XLSX document
+# Everything is a generator over rows, so a large statement is never loaded as a whole.
+# Blocking (file reads): run from a worker thread.
+import csv
+import io
+from datetime import date, datetime
+
+from utils import parse_amount
+
+MAX_IMPORT_ROWS = 1000       # accepted rows per import
+MAX_REJECT_DETAILS = 10      # rejected lines listed in the summary
+
+DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%Y-%m-%d", "%d/%m/%y")
+
+# header names -> field, for files exported from a bank or another tracker
+HEADER_ALIASES = {
+    "date": "date", "day": "date", "transaction date": "date", "txn date": "date", "value date": "date",
+    "category": "category", "description": "category", "desc": "category", "merchant": "category",
+    "details": "category", "narration": "category", "payee": "category",
+    "amount": "amount", "debit": "amount", "withdrawal": "amount", "value": "amount", "spent": "amount",
+    "note": "note", "notes": "note", "memo": "note", "remarks": "note", "comment": "note",
+}
+
+
+def parse_date(value) -> str:
+    """Cell or text -> 'DD/MM/YYYY'; raises ValueError."""
+    if isinstance(value, datetime):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%d/%m/%Y")
+        except ValueError:
+            continue
+    raise ValueError(f"bad date '{text}'")
+
+
+def _is_date(value) -> bool:
+    try:
+        parse_date(value)
+        return True
+    except ValueError:
+        return False
+
+
+def _header_map(cells: list) -> dict | None:
+    """{field: column} if the row looks like a header with at least an amount column."""
+    columns = {}
+    for i, cell in enumerate(cells):
+        field = HEADER_ALIASES.get(str(cell or "").strip().lower())
+        if field and field not in columns:
+            columns[field] = i
+    return columns if "amount" in columns else None
+
+
+def _positional(cells: list) -> dict:
+    """[date,] category, amount [, note...] — the same order the single-user bot accepts."""
+    if len(cells) < 2:
+        raise ValueError("expected: [date,] category, amount [, note]")
+    if len(cells) >= 3 and _is_date(cells[0]):
+        date_v, category, amount, note = cells[0], cells[1], cells[2], cells[3:]
+    else:
+        date_v, category, amount, note = None, cells[0], cells[1], cells[2:]
+    return {"date": date_v, "category": category, "amount": amount,
+            "note": ", ".join(str(c) for c in note if c not in (None, ""))}
+
+
+def _expense(fields: dict, today: str) -> dict:
+    category = str(fields.get("category") or "").strip().lower()
+    if not category:
+        raise ValueError("missing category")
+    amount_v = fields.get("amount")
+    if isinstance(amount_v, (int, float)):
+        amount = float(amount_v)
+    else:
+        amount = parse_amount(str(amount_v or ""))
+    date_v = fields.get("date")
+    return {
+        "date": parse_date(date_v) if date_v not in (None, "") else today,
+        "category": category,
+        "amount": amount,
+        "note": str(fields.get("note") or "").strip(),
+    }
+
+
+def parse_records(records, today: str):
+    """Yield (line_no, expense, None) or (line_no, None, reason) for each non-empty record.
+
+    The first record may be a header (date/category/amount/note, or common bank-export
+    names); otherwise columns are positional.
+    """
+    columns = None
+    for line_no, cells in enumerate(records, start=1):
+        cells = [c.strip() if isinstance(c, str) else c for c in cells]
+        if not any(c not in (None, "") for c in cells):
+            continue
+        if line_no == 1:
+            columns = _header_map(cells)
+            if columns:
+                continue
+        try:
+            if columns:
+                fields = {f: cells[i] if i < len(cells) else None for f, i in columns.items()}
+            else:
+                fields = _positional(cells)
+            yield line_no, _expense(fields, today), None
+        except ValueError as e:
+            yield line_no, None, str(e)
+
+
+def text_records(text: str):
+    """Lines of a message as cell lists (comma separated, or tab/semicolon if the line uses those)."""
+    for line in io.StringIO(text):
+        line = line.strip()
+        delimiter = "\t" if "\t" in line else (";" if ";" in line and "," not in line else ",")
+        yield next(csv.reader([line], delimiter=delimiter), [])
+
+
+def csv_records(path: str):
+    """Rows of a CSV file, read lazily; the delimiter is sniffed from the first lines."""
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def xlsx_records(path: str):
+    """Rows of the first worksheet of an .xlsx file (needs openpyxl)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX import needs openpyxl (pip install openpyxl); send a CSV instead")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        wb.close()
+
+
+def records_for_file(path: str, file_name: str):
+    name = (file_name or "").lower()
+    if name.endswith((".xlsx", ".xlsm")):
+        return xlsx_records(path)
+    if name.endswith((".csv", ".txt", ".tsv")) or not name:
+        return csv_records(path)
+    raise ValueError("unsupported file type; send .csv or .xlsx")
+
+
+def collect(records, today: str, max_rows: int = MAX_IMPORT_ROWS) -> dict:
+    """Run parse_records to completion: accepted expenses plus a bounded list of rejects."""
+    accepted, rejected, details = [], 0, []
+    for line_no, expense, reason in parse_records(records, today):
+        if expense is not None and len(accepted) >= max_rows:
+            reason = f"over the {max_rows} row limit"
+            expense = None
+        if expense is None:
+            rejected += 1
+            if len(details) < MAX_REJECT_DETAILS:
+                details.append(f"line {line_no}: {reason}")
+            continue
+        accepted.append((line_no, expense))
+    return {"accepted": accepted, "rejected": rejected, "details": details}
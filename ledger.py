@@ -0,0 +1,427 @@
+# ledger.py — embedded SQLite ledger: every expense, the local source of truth
+# Writes are group-committed on a single dedicated thread: every insert queued while
+# the previous transaction was committing goes into the next one (one fsync per group).
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from store import ColumnStore
+
+LEDGER_FILE = os.environ.get("LEDGER_FILE", "ledger.db")
+LEGACY_JOURNAL_FILE = "pending_writes.log"  # pre-ledger write-ahead log, imported once
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    tx_id    TEXT UNIQUE,
+    user     TEXT NOT NULL,
+    day      INTEGER NOT NULL,          -- date ordinal
+    date     TEXT NOT NULL,             -- 'DD/MM/YYYY' as written to Sheets
+    category TEXT NOT NULL,
+    amount   REAL NOT NULL,
+    note     TEXT NOT NULL DEFAULT '',
+    synced   INTEGER NOT NULL DEFAULT 0 -- 1 once the row is in Google Sheets
+);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_day ON expenses(user, day);
+CREATE INDEX IF NOT EXISTS idx_expenses_day ON expenses(day);
+CREATE INDEX IF NOT EXISTS idx_expenses_category_day ON expenses(category, day);
+CREATE INDEX IF NOT EXISTS idx_expenses_unsynced ON expenses(id) WHERE synced = 0;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS budgets (
+    user     TEXT NOT NULL,
+    scope    TEXT NOT NULL,             -- '*' for the whole month, else a category
+    amount   REAL NOT NULL,             -- monthly limit
+    chat_id  INTEGER,                   -- where threshold alerts go
+    PRIMARY KEY (user, scope)
+);
+"""
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger")
+_conn: sqlite3.Connection | None = None
+_unsynced: dict = {}   # id -> row, still waiting for Sheets
+_unsynced_since: dict = {}  # id -> time.monotonic() when it became pending
+_pending_ops: list = []
+_pending_futs: list = []
+_flush_task: asyncio.Task | None = None
+
+
+def _connect() -> sqlite3.Connection:
+    """Ledger thread only."""
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(LEDGER_FILE, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=FULL")
+        _conn.execute("PRAGMA busy_timeout=10000")  # shard workers share the file
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+async def _run(fn, *args):
+    """Run fn(conn, *args) on the ledger thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: fn(_connect(), *args))
+
+
+def _parse_row(row: list) -> tuple:
+    """[date, category, amount, note, user, tx_id?] -> column values."""
+    cells = (list(row) + [""] * 6)[:6]
+    date_s, category, amount, note, user, tx_id = cells
+    try:
+        day = datetime.strptime(str(date_s), "%d/%m/%Y").toordinal()
+    except ValueError:
+        day = datetime.now().toordinal()
+    return (tx_id or None, str(user or "unknown"), day, str(date_s),
+            str(category or "uncategorized"), float(amount or 0), str(note or ""))
+
+
+def row_of(rec) -> list:
+    """Ledger record (tx_id, user, day, date, category, amount, note) -> sheet row."""
+    tx_id, user, _, date_s, category, amount, note = rec
+    return [date_s, category, f"{float(amount):.2f}", note or "", user or "", tx_id or ""]
+
+
+def _insert(conn, row: list, synced: int) -> int:
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO expenses (tx_id, user, day, date, category, amount, note, synced) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", _parse_row(row) + (synced,))
+    return cur.lastrowid if cur.rowcount else 0
+
+
+def _apply_group(conn, ops: list) -> list:
+    """One transaction for the whole group; returns each op's result."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        results = [op(conn) for op in ops]
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return results
+
+
+async def _flusher():
+    while _pending_ops:
+        ops = _pending_ops[:]
+        futs = _pending_futs[:]
+        _pending_ops.clear()
+        _pending_futs.clear()
+        try:
+            results = await _run(_apply_group, ops)
+        except Exception as e:
+            for fut in futs:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        for fut, res in zip(futs, results):
+            if not fut.done():
+                fut.set_result(res)
+
+
+def _submit(op) -> asyncio.Future:
+    global _flush_task
+    fut = asyncio.get_running_loop().create_future()
+    _pending_ops.append(op)
+    _pending_futs.append(fut)
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(_flusher())
+    return fut
+
+
+async def append(row: list) -> int:
+    """Durably record a new expense row (not yet in Sheets); returns its ledger id."""
+    lid = await _submit(lambda conn: _insert(conn, row, 0))
+    if lid:
+        _unsynced[lid] = row
+        _unsynced_since[lid] = time.monotonic()
+    return lid
+
+
+async def append_many(rows: list) -> list:
+    """Record several new rows in one transaction; returns their ids (0 for duplicates)."""
+    if not rows:
+        return []
+    ids = await _submit(lambda conn: [_insert(conn, row, 0) for row in rows])
+    now = time.monotonic()
+    for lid, row in zip(ids, rows):
+        if lid:
+            _unsynced[lid] = row
+            _unsynced_since[lid] = now
+    return ids
+
+
+async def commit(ids: list):
+    """Mark rows as synced to Sheets so they are not replayed."""
+    ids = [i for i in ids if i]
+    if not ids:
+        return
+    for lid in ids:
+        _unsynced.pop(lid, None)
+        _unsynced_since.pop(lid, None)
+    marks = ",".join("?" * len(ids))
+    await _submit(lambda conn: conn.execute(f"UPDATE expenses SET synced = 1 WHERE id IN ({marks})", ids))
+
+
+def pending_rows() -> dict:
+    """Snapshot of {id: row} accepted but not yet confirmed in Sheets."""
+    return dict(_unsynced)
+
+
+def oldest_pending_age() -> float:
+    """Seconds the oldest unsynced row has been waiting (0 if none)."""
+    if not _unsynced_since:
+        return 0.0
+    return time.monotonic() - min(_unsynced_since.values())
+
+
+def _import_legacy_journal(conn):
+    """Move rows left unsynced in the old pending_writes.log into the ledger (once)."""
+    if not os.path.exists(LEGACY_JOURNAL_FILE):
+        return
+    entries = {}
+    with open(LEGACY_JOURNAL_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except Exception:
+                continue
+            if rec.get("op") == "add":
+                entries[int(rec["id"])] = rec["row"]
+            elif rec.get("op") == "commit":
+                for jid in rec.get("ids", []):
+                    entries.pop(int(jid), None)
+    _apply_group(conn, [lambda c, r=row: _insert(c, r, 0) for _, row in sorted(entries.items())])
+    os.replace(LEGACY_JOURNAL_FILE, LEGACY_JOURNAL_FILE + ".imported")
+
+
+def _read_unsynced(conn) -> list:
+    _import_legacy_journal(conn)
+    cur = conn.execute(
+        "SELECT id, tx_id, user, day, date, category, amount, note FROM expenses WHERE synced = 0 ORDER BY id")
+    return [(r[0], row_of(r[1:])) for r in cur.fetchall()]
+
+
+async def replay() -> list:
+    """Rows left unsynced by a previous run; returns [(id, row), ...]."""
+    entries = await _run(_read_unsynced)
+    _unsynced.clear()
+    _unsynced.update(entries)
+    now = time.monotonic()
+    _unsynced_since.clear()
+    _unsynced_since.update({lid: now for lid, _ in entries})
+    return entries
+
+
+def _set_sheet_rows(conn, counts: dict, replace: bool = False):
+    if replace:
+        conn.execute("DELETE FROM meta WHERE key LIKE 'sheet_rows:%'")
+    conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                     [("sheet_rows:" + month, int(n)) for month, n in counts.items()])
+
+
+def _replace_synced(conn, rows: list, sheet_rows: dict | None):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM expenses WHERE synced = 1")
+        for row in rows:
+            _insert(conn, row, 1)
+        if sheet_rows is not None:
+            _set_sheet_rows(conn, sheet_rows, replace=True)
+        # synced rows got new ids: tell processes following the ledger to reload
+        conn.execute("INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+async def replace_synced(rows: list, sheet_rows: dict | None = None):
+    """Full resync: the sheet's rows replace every synced ledger row (unsynced rows are kept).
+
+    sheet_rows ({month sheet: rows read, header included}) replaces the stored counts in the same transaction.
+    """
+    await _run(_replace_synced, rows, sheet_rows)
+
+
+async def add_synced(rows: list, sheet_rows: dict | None = None):
+    """Record rows found in the sheet that the bot didn't write (hand-added), and update the stored row counts."""
+    if rows or sheet_rows:
+        def op(conn):
+            for row in rows:
+                _insert(conn, row, 1)
+            if sheet_rows:
+                _set_sheet_rows(conn, sheet_rows)
+        await _submit(op)
+
+
+def _load_sheet_rows(conn) -> dict:
+    return {key[len("sheet_rows:"):]: value for key, value in
+            conn.execute("SELECT key, value FROM meta WHERE key LIKE 'sheet_rows:%'")}
+
+
+async def sheet_rows() -> dict:
+    """{month sheet: rows already reflected in the ledger} as of the last reconcile; empty before the first."""
+    return await _run(_load_sheet_rows)
+
+
+def _known_tx_ids(conn, tx_ids: list) -> set:
+    found = set()
+    for i in range(0, len(tx_ids), 500):
+        chunk = tx_ids[i:i + 500]
+        found.update(r[0] for r in conn.execute(
+            "SELECT tx_id FROM expenses WHERE tx_id IN (%s)" % ",".join("?" * len(chunk)), chunk))
+    return found
+
+
+async def known_tx_ids(tx_ids: list) -> set:
+    """The given tx ids that are already in the ledger."""
+    if not tx_ids:
+        return set()
+    return await _run(_known_tx_ids, list(tx_ids))
+
+
+def _load_store(conn, owns, chunk_size: int = 5000) -> tuple:
+    store = ColumnStore(normalize_categories=True)
+    last_id = 0
+    cur = conn.execute("SELECT id, user, day, category, amount, note FROM expenses ORDER BY id")
+    while True:
+        chunk = cur.fetchmany(chunk_size)
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        store.extend(r[1:] for r in chunk if owns is None or owns(r[1]))
+    return store, last_id
+
+
+async def load_store(owns=None) -> tuple:
+    """(store, last id): every expense (or those whose user passes owns(user)) in a columnar store.
+
+    Built on the ledger thread — the input for the in-memory aggregates.
+    """
+    return await _run(_load_store, owns)
+
+
+def _generation(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return row[0] if row else 0
+
+
+async def generation() -> int:
+    """Bumped by every full resync (replace_synced)."""
+    return await _run(_generation)
+
+
+async def request_resync():
+    """Ask the Sheets writer process for a full resync (sharded mode: /resync on a shard)."""
+    await _submit(lambda conn: conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('resync_requested', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1").rowcount)
+
+
+def _resync_requests(conn) -> int:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'resync_requested'").fetchone()
+    return row[0] if row else 0
+
+
+async def resync_requests() -> int:
+    """Number of resyncs ever requested through request_resync."""
+    return await _run(_resync_requests)
+
+
+def _set_budget(conn, user: str, scope: str, amount: float, chat_id):
+    if amount > 0:
+        conn.execute("INSERT INTO budgets (user, scope, amount, chat_id) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(user, scope) DO UPDATE SET amount = excluded.amount, chat_id = excluded.chat_id",
+                     (user, scope, float(amount), chat_id))
+    else:
+        conn.execute("DELETE FROM budgets WHERE user = ? AND scope = ?", (user, scope))
+    return 1
+
+
+async def set_budget(user: str, scope: str, amount: float, chat_id=None):
+    """Store a monthly budget (amount <= 0 deletes it)."""
+    await _submit(lambda conn: _set_budget(conn, user, scope, amount, chat_id))
+
+
+def _load_budgets(conn) -> list:
+    return conn.execute("SELECT user, scope, amount, chat_id FROM budgets").fetchall()
+
+
+async def load_budgets() -> list:
+    """Every stored budget as (user, scope, amount, chat_id)."""
+    return await _run(_load_budgets)
+
+
+def _rows_after(conn, last_id: int, limit: int) -> list:
+    return conn.execute(
+        "SELECT id, tx_id, user, day, date, category, amount, note FROM expenses WHERE id > ? ORDER BY id LIMIT ?",
+        (last_id, limit)).fetchall()
+
+
+async def rows_after(last_id: int, limit: int = 5000) -> list:
+    """[(id, tx_id, user, day, date, category, amount, note), ...] added after last_id (by any process)."""
+    return await _run(_rows_after, last_id, limit)
+
+
+def _unsynced_after(conn, last_id: int, limit: int) -> list:
+    cur = conn.execute(
+        "SELECT id, tx_id, user, day, date, category, amount, note FROM expenses "
+        "WHERE synced = 0 AND id > ? ORDER BY id LIMIT ?", (last_id, limit))
+    return [(r[0], row_of(r[1:])) for r in cur.fetchall()]
+
+
+async def unsynced_after(last_id: int, limit: int = 5000) -> list:
+    """Unsynced rows other processes appended after last_id; tracked as pending here. [(id, row), ...]"""
+    entries = await _run(_unsynced_after, last_id, limit)
+    now = time.monotonic()
+    for lid, row in entries:
+        _unsynced[lid] = row
+        _unsynced_since[lid] = now
+    return entries
+
+
+def _synced_ids(conn, ids: list) -> list:
+    out = []
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        marks = ",".join("?" * len(part))
+        out += [r[0] for r in conn.execute(
+            f"SELECT id FROM expenses WHERE synced = 1 AND id IN ({marks})", part)]
+    return out
+
+
+async def forget_synced() -> int:
+    """Drop pending rows another process has since marked synced; returns how many."""
+    ids = await _run(_synced_ids, list(_unsynced))
+    for lid in ids:
+        _unsynced.pop(lid, None)
+        _unsynced_since.pop(lid, None)
+    return len(ids)
+
+
+def iter_expenses(user: str, start_day: int, end_day: int, chunk_size: int = 1000):
+    """Blocking generator of row chunks [(day, date, category, amount, note, tx_id), ...], oldest first.
+
+    Uses its own read-only connection (WAL lets it read while the ledger thread writes),
+    so it can run in any worker thread without holding up appends.
+    """
+    uri = "file:" + urllib.parse.quote(os.path.abspath(LEDGER_FILE)) + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    try:
+        cur = conn.execute(
+            "SELECT day, date, category, amount, note, tx_id FROM expenses "
+            "WHERE user = ? AND day BETWEEN ? AND ? ORDER BY day, id", (user, start_day, end_day))
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        conn.close()
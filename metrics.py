@@ -0,0 +1,191 @@
+# metrics.py — in-process counters, gauges and latency histograms, Prometheus text format
+# Recording is a dict lookup plus an add; gauges are callbacks evaluated only when scraped.
+import asyncio
+import bisect
+import os
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # 0 = no HTTP endpoint
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+
+
+def _fmt_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._children: dict = {}
+        _registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(sorted(labels.items()))
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._children.items():
+            lines.extend(child.render(self.name, key))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def render(self, name, key):
+        return [f"{name}{_fmt_labels(key)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, key):
+        lines = []
+        running = 0
+        for le, c in zip(self.buckets, self.counts):
+            running += c
+            bucket_labels = _fmt_labels(key, 'le="%s"' % le)
+            lines.append(f"{name}_bucket{bucket_labels} {running}")
+        inf_labels = _fmt_labels(key, 'le="+Inf"')
+        lines.append(f"{name}_bucket{inf_labels} {self.count}")
+        lines.append(f"{name}_sum{_fmt_labels(key)} {self.sum}")
+        lines.append(f"{name}_count{_fmt_labels(key)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+
+class Gauge(_Metric):
+    """Value computed by a callback at scrape time (free when nobody scrapes)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn=None):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    def set_function(self, fn):
+        self.fn = fn
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            value = self.fn() if self.fn else None
+        except Exception:
+            value = None
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                lines.append(f"{self.name}{_fmt_labels(tuple(sorted(dict(labels).items())))} {float(v)}")
+        elif value is not None:
+            lines.append(f"{self.name} {float(value)}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- metrics for the bot's hot paths ---------------------------------------
+
+WRITE_QUEUE_DEPTH = Gauge("spendbot_write_queue_depth", "Rows waiting in the Sheets write queue")
+OLDEST_UNSYNCED_AGE = Gauge("spendbot_oldest_unsynced_age_seconds", "Age of the oldest row not yet in Sheets")
+SHEETS_BUDGET = Gauge("spendbot_sheets_tokens", "Rate limiter tokens left per bucket")
+SHEETS_WAIT = Gauge("spendbot_sheets_wait_seconds", "Rate limiter wait before the next call per bucket")
+SHEETS_CALLS = Counter("spendbot_sheets_calls_total", "Google Sheets API calls by kind and outcome")
+SHEETS_LATENCY = Histogram("spendbot_sheets_call_seconds", "Google Sheets API call latency")
+WRITER_ROWS = Counter("spendbot_writer_rows_total", "Rows written to Sheets by the background writer")
+WRITER_RETRIES = Counter("spendbot_writer_retries_total", "Background writer batch retries by reason")
+CACHE_LOCK_WAIT = Histogram("spendbot_cache_lock_wait_seconds", "Time spent waiting for _cache_lock",
+                            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0))
+CHART_RENDER = Histogram("spendbot_chart_render_seconds", "Chart render time (cache misses)")
+CHART_CACHE_HITS = Counter("spendbot_chart_cache_hits_total", "Charts served from the PNG cache")
+EXPENSES_ADDED = Counter("spendbot_expenses_added_total", "Expenses accepted by add_expense")
+
+
+# --- local HTTP endpoint ----------------------------------------------------
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split()[1] if len(request_line.split()) > 1 else b"/"
+        if path.startswith(b"/metrics"):
+            body, status = render().encode("utf-8"), "200 OK"
+        else:
+            body, status = b"not found\n", "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+    except Exception:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve GET /metrics on host:port (no-op when port is 0)."""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"[metrics] serving on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,68 @@
+# ratelimit.py — token buckets that keep Google Sheets calls under the per-minute quota
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket sized so that no 60s window can exceed per_minute calls.
+
+    Up to `burst` calls go out immediately; after that tokens refill at
+    (per_minute - burst) / 60 per second. Callers reserve a token and sleep for the
+    returned delay, so waiting callers are served in arrival order.
+    """
+
+    def __init__(self, per_minute: int, burst: int = 10):
+        if per_minute < 2:
+            raise ValueError(f"per_minute must be at least 2 (one burst token plus refill), got {per_minute}")
+        self.per_minute = per_minute
+        self.burst = max(1, min(burst, per_minute - 1))
+        self.rate = (per_minute - self.burst) / 60.0
+        self._tokens = float(self.burst)
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_total = 0.0  # seconds callers spent throttled (for monitoring)
+
+    def _refill(self, now: float):
+        self._tokens = min(float(self.burst), self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def reserve(self) -> float:
+        """Take a token (possibly borrowing from the future); returns seconds to wait before the call."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1.0
+            delay = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+            self.waited_total += delay
+            return delay
+
+    def acquire(self):
+        """Blocking: wait for a token (use from worker threads)."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def penalize(self, seconds: float):
+        """After a quota error: make the next caller wait at least `seconds`."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def wait_time(self) -> float:
+        """Seconds until a new caller would get a token."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def snapshot(self) -> dict:
+        return {
+            "per_minute": self.per_minute,
+            "tokens": round(self.tokens(), 2),
+            "wait_seconds": round(self.wait_time(), 2),
+            "throttled_seconds_total": round(self.waited_total, 2),
+        }
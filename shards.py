@@ -0,0 +1,132 @@
+# shards.py — sharded mode: one front process receives updates, N worker processes serve them
+#
+#   SHARDS=4 python app.py
+#
+# The front process runs the Telegram updater (polling or webhook), the single Sheets
+# writer and the reconciler, and hands each update to the worker that owns its user
+# (handlers.shard_of). Workers keep only their users' caches and conversations and
+# append expenses to the shared SQLite ledger, which the writer drains to Sheets.
+import asyncio
+import multiprocessing as mp
+import os
+import queue
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+import app as bot_app
+import handlers
+
+WORKER_STOP_TIMEOUT = 30.0  # seconds to wait for a worker to finish its updates on shutdown
+WORKER_RESTART_DELAY = 5.0  # min seconds between restarts of one worker (one that dies on start must not spin)
+
+
+def _route_key(update: Update) -> str | None:
+    user = update.effective_user
+    if user:
+        return handlers._user_key(user.username, user.id)
+    chat = update.effective_chat
+    return str(chat.id) if chat else None
+
+
+def _next_update(inbox):
+    """Blocking: next update dict from the front process, or None when it stops (or dies)."""
+    parent = mp.parent_process()
+    while True:
+        try:
+            return inbox.get(timeout=1.0)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                return None
+
+
+async def _worker(index: int, token: str, inbox):
+    application = bot_app.build_application(token, updater=False)
+    await application.initialize()
+    await handlers.warm_up(application)
+    await application.start()
+    print(f"[shard {index}] ready (pid {os.getpid()})")
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, _next_update, inbox)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await handlers.shutdown(application)
+
+
+def _worker_main(index: int, count: int, token: str, inbox):
+    # the front process decides when to stop (Ctrl+C reaches the whole process group)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    handlers.configure_shard("shard", index, count)
+    asyncio.run(_worker(index, token, inbox))
+
+
+def _start_worker(ctx, index: int, count: int, token: str):
+    """Spawn shard `index` with a fresh inbox; returns (inbox, process)."""
+    inbox = ctx.Queue()
+    worker = ctx.Process(target=_worker_main, args=(index, count, token, inbox), name=f"spendbot-shard-{index}")
+    worker.start()
+    return inbox, worker
+
+
+def run(token: str, count: int):
+    """Start `count` shard workers and serve updates from this process (blocks until stopped)."""
+    ctx = mp.get_context("spawn")
+    inboxes, workers = [], []
+    for i in range(count):
+        inbox, worker = _start_worker(ctx, i, count, token)
+        inboxes.append(inbox)
+        workers.append(worker)
+    started = [time.monotonic()] * count
+    handlers.configure_shard("writer", 0, count)
+
+    def ensure_alive(i: int) -> bool:
+        """Restart shard i if it died (updates left in its old inbox are lost); False while it can't be."""
+        worker = workers[i]
+        if worker.is_alive():
+            return True
+        if time.monotonic() - started[i] < WORKER_RESTART_DELAY:
+            return False
+        print(f"[shards] {worker.name} exited (code {worker.exitcode}), restarting it")
+        old = inboxes[i]
+        old.cancel_join_thread()  # nobody will read it: don't block exit flushing it
+        old.close()
+        inboxes[i], workers[i] = _start_worker(ctx, i, count, token)
+        started[i] = time.monotonic()
+        return True
+
+    async def route(update: Update, context):
+        key = _route_key(update)
+        i = handlers.shard_of(key, count) if key else 0
+        if not ensure_alive(i):
+            print(f"[shards] {workers[i].name} is down, dropping update {update.update_id}")
+            return
+        inboxes[i].put(update.to_dict())
+
+    async def stop(application):
+        for inbox in inboxes:
+            inbox.put(None)
+
+        def join():
+            for w in workers:
+                w.join(WORKER_STOP_TIMEOUT)
+                if w.is_alive():
+                    print(f"[shards] {w.name} did not stop, terminating")
+                    w.terminate()
+
+        await asyncio.to_thread(join)
+        # the shards have stopped adding rows: drain the Sheets writer
+        await handlers.shutdown(application)
+
+    front = ApplicationBuilder().token(token).post_init(handlers.warm_up).post_shutdown(stop).build()
+    front.add_handler(TypeHandler(Update, route))
+    print(f"[shards] {count} workers")
+    bot_app.serve(front)
@@ -1,57 +1,426 @@
+import asyncio
+import calendar
 import os
-from datetime import datetime
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import gspread
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+
+import metrics
+
+from ratelimit import TokenBucket
+from store import ColumnStore
 
 SHEET_NAME = os.environ.get("SHEET_NAME", "SPEND_BOT_TRACK")
 CREDS_PATH = os.environ.get("GOOGLE_CREDS", "credentials.json")
 
-# Blocking setup (we will call from async via asyncio.to_thread)
+# Sheets API quota is per minute and counted separately for reads and writes.
+# Every gspread call below takes a token first, so we slow down before Google says no.
+READS_PER_MINUTE = int(os.environ.get("SHEETS_READS_PER_MINUTE", "60"))
+WRITES_PER_MINUTE = int(os.environ.get("SHEETS_WRITES_PER_MINUTE", "60"))
+QUOTA_PENALTY = 60.0  # seconds to hold a bucket after Google reports quota exhaustion
+read_limiter = TokenBucket(READS_PER_MINUTE)
+write_limiter = TokenBucket(WRITES_PER_MINUTE)
+
+# Blocking setup: call from async code through run(), which uses dedicated threads. A
+# throttled call sleeps in its thread (for up to QUOTA_PENALTY after a 429), so Sheets
+# calls must not share the default executor with snapshots, imports and exports.
+SHEETS_THREADS = int(os.environ.get("SHEETS_THREADS", "4"))
+_executor = ThreadPoolExecutor(max_workers=SHEETS_THREADS, thread_name_prefix="sheets")
+# One client per process, shared by every Sheets thread: authenticated once, over a
+# keep-alive connection pool, with the access token renewed ahead of expiry (refresh_token).
+HTTP_POOL_SIZE = int(os.environ.get("SHEETS_HTTP_POOL", str(SHEETS_THREADS)))
+TOKEN_REFRESH_AHEAD = 600.0  # seconds before expiry refresh_token renews the access token
 _gc = None
 _sh = None
+_creds = None
+_client_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_token_request = Request()
+
+# Process-level caches: month name -> worksheet object, and months whose header is known to exist.
+# Only invalidated when Google tells us the worksheet is gone.
+_ws_cache = {}
+_header_ok = set()
+_last_row = {}  # month -> last sheet row number our appends are known to have reached
+
+async def run(fn, *args):
+    """Run a blocking function of this module on the Sheets threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: fn(*args))
+
+
+def is_quota_error(e: Exception) -> bool:
+    """True for HTTP 429 / RATE_LIMIT_EXCEEDED responses."""
+    if not isinstance(e, gspread.exceptions.APIError):
+        return False
+    status = getattr(getattr(e, "response", None), "status_code", None)
+    return status == 429 or "RATE_LIMIT_EXCEEDED" in str(e) or "Quota exceeded" in str(e)
+
+
+def _call(bucket: TokenBucket, fn, *args, **kwargs):
+    """Run one gspread call under a rate-limit bucket (blocking: call from a worker thread)."""
+    kind = "write" if bucket is write_limiter else "read"
+    bucket.acquire()
+    t = time.perf_counter()
+    outcome = "ok"
+    try:
+        return fn(*args, **kwargs)
+    except gspread.exceptions.APIError as e:
+        outcome = "error"
+        if is_quota_error(e):
+            outcome = "quota"
+            bucket.penalize(QUOTA_PENALTY)
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        metrics.SHEETS_LATENCY.labels(kind=kind).observe(time.perf_counter() - t)
+        metrics.SHEETS_CALLS.labels(kind=kind, outcome=outcome).inc()
+
+
+def _read(fn, *args, **kwargs):
+    return _call(read_limiter, fn, *args, **kwargs)
+
+
+def _write(fn, *args, **kwargs):
+    return _call(write_limiter, fn, *args, **kwargs)
+
+
+def rate_budget() -> dict:
+    """Current read/write budget and wait time, for monitoring."""
+    return {"read": read_limiter.snapshot(), "write": write_limiter.snapshot()}
+
+
+def _session(creds) -> AuthorizedSession:
+    """Authorized session whose connection pool has room for every worker thread."""
+    session = AuthorizedSession(creds)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    return session
+
 
 def _ensure_client():
-    global _gc, _sh
-    if _gc is None:
-        _gc = gspread.service_account(filename=CREDS_PATH)
-    if _sh is None:
-        _sh = _gc.open(SHEET_NAME)
-    return _gc, _sh
+    global _gc, _sh, _creds
+    gc, sh = _gc, _sh
+    if gc is not None and sh is not None:
+        return gc, sh
+    with _client_lock:  # concurrent first calls wait here instead of authenticating again
+        if _gc is None:
+            _creds = Credentials.from_service_account_file(CREDS_PATH, scopes=gspread.auth.DEFAULT_SCOPES)
+            refresh_token()
+            _gc = gspread.Client(auth=_creds, session=_session(_creds))
+        if _sh is None:
+            _sh = _read(_gc.open, SHEET_NAME)
+        return _gc, _sh
+
+
+def connect():
+    """Authenticate and open the spreadsheet now (blocking), so the first request doesn't pay for it."""
+    _ensure_client()
+
+
+def refresh_token(ahead: float = TOKEN_REFRESH_AHEAD) -> float:
+    """Renew the access token if it expires within `ahead` seconds; returns seconds left on it (blocking)."""
+    creds = _creds
+    if creds is None:
+        return 0.0
+    with _refresh_lock:
+        if not creds.token or creds.expiry is None or _token_ttl(creds) <= ahead:
+            creds.refresh(_token_request)
+        return _token_ttl(creds) if creds.expiry is not None else float(ahead)
+
+
+def _token_ttl(creds) -> float:
+    # google-auth keeps expiry as naive UTC
+    return (creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds()
+
+def _is_missing_sheet(e: Exception) -> bool:
+    """True if the error means the worksheet no longer exists (deleted or renamed by hand)."""
+    if isinstance(e, gspread.exceptions.WorksheetNotFound):
+        return True
+    return isinstance(e, gspread.exceptions.APIError) and "Unable to parse range" in str(e)
+
+
+def invalidate_month_sheet(month_name: str):
+    """Forget the cached worksheet handle and header flag for a month."""
+    _ws_cache.pop(month_name, None)
+    _header_ok.discard(month_name)
+    _last_row.pop(month_name, None)
+
 
 def ensure_month_sheet(month_name: str):
     """Ensure worksheet for the month exists; returns the worksheet object"""
+    ws = _ws_cache.get(month_name)
+    if ws is not None:
+        return ws
     _, sh = _ensure_client()
-    titles = [ws.title for ws in sh.worksheets()]
-    if month_name not in titles:
-        sh.add_worksheet(title=month_name, rows="500", cols="10")
-    return sh.worksheet(month_name)
+    try:
+        ws = _read(sh.worksheet, month_name)
+    except gspread.exceptions.WorksheetNotFound:
+        ws = _write(sh.add_worksheet, title=month_name, rows="500", cols="10")
+        _add_to_index([month_name])
+    _ws_cache[month_name] = ws
+    return ws
+
+HEADER = ["Date", "Category", "Amount", "Notes", "User", "TxID"]
+TX_TAIL_ROWS = 200  # rows above the last known append checked for duplicate tx ids
+MONTH_NAMES = [calendar.month_name[i] for i in range(1, 13)]
+# One worksheet per calendar month, e.g. "September 2026". Sheets named by month only
+# ("September") come from before that and are still read, never written.
+MONTH_SHEET_RE = re.compile(r"^(%s) (\d{4})$" % "|".join(MONTH_NAMES))
+
+# Small sheet listing the month partitions, oldest first: Sheet | Year | Month
+INDEX_SHEET = "Index"
+INDEX_HEADER = ["Sheet", "Year", "Month"]
+_index_titles = None  # titles known to be listed in the index sheet (loaded once)
+
+
+def month_title(dt: datetime) -> str:
+    return dt.strftime("%B %Y")
+
+
+def month_titles_for_year(year: int) -> list:
+    return [f"{name} {year}" for name in MONTH_NAMES]
+
+
+def month_for_row(row: list) -> str:
+    """Worksheet name a row belongs to, taken from its 'DD/MM/YYYY' date (falls back to now)."""
+    try:
+        dt = datetime.strptime(str(row[0]), "%d/%m/%Y")
+    except Exception:
+        dt = datetime.now()
+    return month_title(dt)
+
+
+def _month_sort_key(title: str) -> tuple:
+    m = MONTH_SHEET_RE.match(title)
+    if m:
+        return int(m.group(2)), MONTH_NAMES.index(m.group(1)) + 1
+    return 0, MONTH_NAMES.index(title) + 1 if title in MONTH_NAMES else 0
+
+
+def _index_sheet():
+    ws = _ws_cache.get(INDEX_SHEET)
+    if ws is None:
+        _, sh = _ensure_client()
+        try:
+            ws = _read(sh.worksheet, INDEX_SHEET)
+        except gspread.exceptions.WorksheetNotFound:
+            ws = _write(sh.add_worksheet, title=INDEX_SHEET, rows="200", cols="3")
+        _ws_cache[INDEX_SHEET] = ws
+    # header checked once per process, so a failed first write is retried on the next call
+    if INDEX_SHEET not in _header_ok:
+        if not _read(ws.acell, "A1").value:
+            _write(ws.append_rows, [INDEX_HEADER])
+        _header_ok.add(INDEX_SHEET)
+    return ws
+
+
+def _add_to_index(titles: list):
+    """List new year-qualified month sheets in the index (best effort: it's informational)."""
+    global _index_titles
+    titles = [t for t in titles if MONTH_SHEET_RE.match(t)]
+    if not titles:
+        return
+    try:
+        ws = _index_sheet()
+        if _index_titles is None:
+            _index_titles = {r[0] for r in _read(ws.get, "A2:A") if r}
+        missing = sorted((t for t in titles if t not in _index_titles), key=_month_sort_key)
+        if missing:
+            rows = []
+            for t in missing:
+                year, month = _month_sort_key(t)
+                rows.append([t, year, month])
+            _write(ws.append_rows, rows)
+            _index_titles.update(missing)
+    except Exception as e:
+        if _is_missing_sheet(e):
+            invalidate_month_sheet(INDEX_SHEET)
+            _index_titles = None
+        print("[sheets] index update failed:", e)
+
+
+def group_rows_by_month(rows: list) -> dict:
+    """Group rows by target month worksheet, keeping their original order."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(month_for_row(row), []).append(row)
+    return groups
+
+
+def append_rows_to_month(month: str, rows: list):
+    """Append many rows to one month worksheet with a single bulk append."""
+    if not rows:
+        return
+    try:
+        _append_rows(month, rows)
+    except Exception as e:
+        if not _is_missing_sheet(e):
+            raise
+        # sheet was removed behind our back: drop the stale handle and recreate once
+        invalidate_month_sheet(month)
+        _append_rows(month, rows)
+
+
+def _append_rows(month: str, rows: list):
+    ws = ensure_month_sheet(month)
+    # Ensure header (checked once per month per process, written in the same request as the rows)
+    if month not in _header_ok and not _read(ws.acell, "A1").value:
+        rows = [HEADER] + list(rows)
+    resp = _write(ws.append_rows, rows)
+    _header_ok.add(month)
+    _note_last_row(month, resp)
+
+
+def _note_last_row(month: str, resp):
+    """Remember where an append ended, from updates.updatedRange like "'May'!A5:F7"."""
+    try:
+        rng = resp["updates"]["updatedRange"]
+        last = int(re.search(r"(\d+)$", rng).group(1))
+    except Exception:
+        return
+    _last_row[month] = max(_last_row.get(month, 0), last)
+
+
+def find_tx_ids(month: str, tx_ids: list) -> set:
+    """Which of tx_ids already appear in the month sheet's TxID column (recent tail only)."""
+    ws = ensure_month_sheet(month)
+    start = max(1, _last_row.get(month, 1) - TX_TAIL_ROWS)
+    values = _read(ws.get, f"F{start}:F")
+    present = {r[0] for r in values if r}
+    return present & set(tx_ids)
+
+
+def append_transactions(rows: list):
+    """Append a batch of rows: one bulk append per month worksheet"""
+    for month, group in group_rows_by_month(rows).items():
+        append_rows_to_month(month, group)
+
 
 def append_transaction(row: list):
     """Append a row: [date, category, amount, notes, user]"""
-    month = datetime.now().strftime("%B")
-    ws = ensure_month_sheet(month)
-    # Ensure header
-    if not ws.acell("A1").value:
-        ws.append_row(["Date", "Category", "Amount", "Notes", "User"])
-    ws.append_row(row)
+    append_transactions([row])
+
+def list_month_sheets() -> list:
+    """Titles of the month worksheets (year-qualified and legacy), oldest first.
+
+    One metadata call; refreshes the handle cache and lists any month sheet the index
+    doesn't know about yet (e.g. created by hand).
+    """
+    _, sh = _ensure_client()
+    titles = []
+    for ws in _read(sh.worksheets):
+        if ws.title in MONTH_NAMES or MONTH_SHEET_RE.match(ws.title):
+            _ws_cache.setdefault(ws.title, ws)
+            titles.append(ws.title)
+    titles.sort(key=_month_sort_key)
+    if _index_titles is None or any(MONTH_SHEET_RE.match(t) and t not in _index_titles for t in titles):
+        _add_to_index(titles)
+    return titles
+
+
+def batch_read_rows(start_rows: dict) -> dict:
+    """Read several month sheets in one values_batch_get request.
+
+    start_rows maps month -> first 1-based row to read (1 = whole sheet including header).
+    Returns month -> list of raw rows (lists of strings, trailing empty cells trimmed).
+    """
+    months = list(start_rows)
+    if not months:
+        return {}
+    _, sh = _ensure_client()
+    resp = _read(sh.values_batch_get, [f"'{m}'!A{int(start_rows[m])}:F" for m in months])
+    value_ranges = resp.get("valueRanges", [])
+    return {m: vr.get("values", []) for m, vr in zip(months, value_ranges)}
+
+
+def _records(rows: list) -> list:
+    """Raw rows under a header row -> list of dicts keyed by HEADER."""
+    out = []
+    for row in rows:
+        if not row or row[:len(HEADER)] == HEADER:
+            continue
+        cells = list(row) + [""] * (len(HEADER) - len(row))
+        out.append(dict(zip(HEADER, cells[:len(HEADER)])))
+    return out
+
+
+def get_records_for_months(months: list) -> dict:
+    """Records for several month sheets with one batched read; months that don't exist map to []."""
+    existing = set(list_month_sheets())
+    data = batch_read_rows({m: 2 for m in months if m in existing})
+    return {m: _records(data.get(m, [])) for m in months}
+
 
 def get_records_for_month(month=None):
     _, sh = _ensure_client()
     if month is None:
-        month = datetime.now().strftime("%B")
+        month = month_title(datetime.now())
+    ws = _ws_cache.get(month)
+    if ws is None:
+        try:
+            ws = _read(sh.worksheet, month)
+        except Exception:
+            return []
+        _ws_cache[month] = ws
     try:
-        ws = sh.worksheet(month)
-    except Exception:
-        return []
-    return ws.get_all_records()  # list of dicts
+        return _read(ws.get_all_records)  # list of dicts
+    except Exception as e:
+        if _is_missing_sheet(e):
+            invalidate_month_sheet(month)
+            return []
+        raise
+
+def records_to_store(records: list, default_day: int | None = None, default_user: str = "",
+                     store: ColumnStore | None = None) -> ColumnStore:
+    """Load sheet records into a columnar store (categories normalized once per distinct value).
 
-def aggregate_by_category(month=None):
-    recs = get_records_for_month(month)
-    agg = {}
-    for r in recs:
+    Rows with an unreadable date get default_day (e.g. the 1st of their sheet's month).
+    """
+    store = store if store is not None else ColumnStore(normalize_categories=True)
+    days = {}
+    fallback = default_day if default_day is not None else datetime.now().toordinal()
+    for r in records:
         try:
             amt = float(r.get("Amount", 0) or 0)
         except Exception:
-            amt = 0
-        cat = (r.get("Category") or "uncategorized").strip().lower()
-        agg[cat] = agg.get(cat, 0) + amt
-    return agg
+            amt = 0.0
+        date_s = str(r.get("Date") or "")
+        day = days.get(date_s)
+        if day is None:
+            try:
+                day = days[date_s] = datetime.strptime(date_s, "%d/%m/%Y").toordinal()
+            except ValueError:
+                day = days[date_s] = fallback
+        store.append(str(r.get("User") or "").strip() or default_user, day,
+                     r.get("Category"), amt, str(r.get("Notes") or ""))
+    return store
+
+
+def aggregate_by_category(month=None, records=None):
+    recs = get_records_for_month(month) if records is None else records
+    return records_to_store(recs).group_by("category")
+
+
+def aggregate_year(year: int, user: str | None = None, default_user: str = "") -> dict:
+    """{month title: {category: amount}} for one year, read in a single batched request.
+
+    With user set, only that user's rows count (rows with no User cell belong to default_user).
+    """
+    store = ColumnStore(normalize_categories=True)
+    for i, (m, recs) in enumerate(get_records_for_months(month_titles_for_year(year)).items(), start=1):
+        records_to_store(recs, datetime(year, i, 1).toordinal(), default_user, store)
+    filters = {"user": user} if user is not None else {}
+    out = {}
+    for (month_k, category), amount in store.group_by("month", "category", **filters).items():
+        title = month_title(datetime.strptime(month_k, "%Y-%m"))
+        out.setdefault(title, {})[category] = amount
+    return dict(sorted(out.items(), key=lambda kv: _month_sort_key(kv[0])))
@@ -0,0 +1,187 @@
+# store.py — compact columnar store for transactions
+# One typed array per column (day ordinal, amount, and dictionary codes for user, category
+# and note) instead of a dict per row: ~24 bytes a transaction, and group-by / filters run
+# vectorized over numpy views of the arrays.
+from array import array
+from datetime import date
+
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+KEYS = ("user", "category", "day", "month", "year")
+
+
+class Dictionary:
+    """Value <-> small integer code; each distinct string is stored (and normalized) once."""
+
+    def __init__(self, normalize=None):
+        self.values: list = []
+        self._codes: dict = {}
+        self._raw: dict = {}  # raw input -> code, so repeats skip normalize()
+        self.normalize = normalize
+
+    def encode(self, raw) -> int:
+        code = self._raw.get(raw)
+        if code is not None:
+            return code
+        value = self.normalize(raw) if self.normalize else ("" if raw is None else str(raw))
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        self._raw[raw] = code
+        return code
+
+    def code_of(self, value):
+        """Code of an already-normalized value, or None if it never occurred."""
+        return self._codes.get(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+def normalize_category(raw) -> str:
+    return (str(raw or "").strip().lower()) or "uncategorized"
+
+
+class ColumnStore:
+    """Append-only transaction table.
+
+    Rows never change once appended, so a row count taken at some point is a stable
+    snapshot of the store: pass it as `n` to read only those rows.
+
+    numpy views are created per query and dropped before it returns (an exported
+    array can't grow). Query from the thread that appends.
+    """
+
+    def __init__(self, normalize_categories: bool = False):
+        self.days = array("i")
+        self.amounts = array("d")
+        self.user_codes = array("I")
+        self.category_codes = array("I")
+        self.note_codes = array("I")
+        self.users = Dictionary()
+        self.categories = Dictionary(normalize_category if normalize_categories else None)
+        self.notes = Dictionary()
+        self.notes.encode("")  # code 0: no note
+
+    def __len__(self):
+        return len(self.days)
+
+    def append(self, user: str, day: int, category: str, amount: float, note: str = ""):
+        self.days.append(day)
+        self.amounts.append(amount)
+        self.user_codes.append(self.users.encode(user))
+        self.category_codes.append(self.categories.encode(category))
+        self.note_codes.append(self.notes.encode(note or ""))
+
+    def extend(self, rows):
+        """rows: iterable of (user, day, category, amount, note)."""
+        for user, day, category, amount, note in rows:
+            self.append(user, day, category, amount, note)
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns (dictionaries not included)."""
+        return sum(a.itemsize * len(a) for a in
+                   (self.days, self.amounts, self.user_codes, self.category_codes, self.note_codes))
+
+    # --- vectorized reads ---------------------------------------------------
+
+    def _view(self, column: array, n: int):
+        return np.frombuffer(column, dtype=column.typecode)[:n] if n else np.empty(0, dtype=column.typecode)
+
+    def _mask(self, n: int, user=None, category=None, start_day=None, end_day=None):
+        """Boolean mask over the first n rows, or None when a filter value never occurred."""
+        mask = np.ones(n, dtype=bool)
+        if user is not None:
+            code = self.users.code_of(user)
+            if code is None:
+                return None
+            mask &= self._view(self.user_codes, n) == code
+        if category is not None:
+            code = self.categories.code_of(category)
+            if code is None:
+                return None
+            mask &= self._view(self.category_codes, n) == code
+        if start_day is not None or end_day is not None:
+            days = self._view(self.days, n)
+            if start_day is not None:
+                mask &= days >= start_day
+            if end_day is not None:
+                mask &= days <= end_day
+        return mask
+
+    def total(self, n: int | None = None, **filters) -> tuple:
+        """(sum of amounts, row count) for rows matching the filters."""
+        n = len(self) if n is None else n
+        mask = self._mask(n, **filters)
+        if mask is None:
+            return 0.0, 0
+        amounts = self._view(self.amounts, n)[mask]
+        return float(amounts.sum()), int(amounts.size)
+
+    def _key_codes(self, key: str, n: int, mask):
+        """(int64 codes, cardinality, decode(code) -> label) for one group-by key."""
+        if key == "user":
+            return self._view(self.user_codes, n)[mask].astype(np.int64), max(1, len(self.users)), \
+                self.users.values.__getitem__
+        if key == "category":
+            return self._view(self.category_codes, n)[mask].astype(np.int64), max(1, len(self.categories)), \
+                self.categories.values.__getitem__
+        days = self._view(self.days, n)[mask].astype(np.int64)
+        if key == "day":
+            lo = int(days.min()) if days.size else 0
+            return days - lo, int(days.max()) - lo + 1 if days.size else 1, lambda c: lo + int(c)
+        months = (days - EPOCH_ORDINAL).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        if key == "month":
+            lo = int(months.min()) if months.size else 0
+            return months - lo, int(months.max()) - lo + 1 if months.size else 1, \
+                lambda c: f"{1970 + (lo + int(c)) // 12:04d}-{(lo + int(c)) % 12 + 1:02d}"
+        if key == "year":
+            years = months // 12
+            lo = int(years.min()) if years.size else 0
+            return years - lo, int(years.max()) - lo + 1 if years.size else 1, lambda c: str(1970 + lo + int(c))
+        raise ValueError(f"unknown group-by key {key!r}; use one of {KEYS}")
+
+    def group_by(self, *keys: str, n: int | None = None, **filters) -> dict:
+        """Sum of amounts per distinct key (or key tuple), e.g. group_by("month", "category", user="bob").
+
+        day keys are date ordinals, month keys 'YYYY-MM', year keys 'YYYY'.
+        """
+        n = len(self) if n is None else n
+        mask = self._mask(n, **filters)
+        if mask is None or not keys:
+            return {}
+        amounts = self._view(self.amounts, n)[mask]
+        if not amounts.size:
+            return {}
+        parts = [self._key_codes(key, n, mask) for key in keys]
+        combined = parts[0][0]
+        for codes, size, _ in parts[1:]:
+            combined = combined * size + codes
+        uniq, inverse = np.unique(combined, return_inverse=True)
+        sums = np.bincount(inverse, weights=amounts)
+        out = {}
+        for value, amount in zip(uniq.tolist(), sums.tolist()):
+            labels = []
+            for _, size, decode in reversed(parts):
+                value, code = divmod(value, size)
+                labels.append(decode(code))
+            labels.reverse()
+            out[labels[0] if len(labels) == 1 else tuple(labels)] = amount
+        return out
+
+    def tail(self, k: int, n: int | None = None) -> list:
+        """The last k of the first n rows as dicts, newest first."""
+        n = len(self) if n is None else n
+        out = []
+        for i in range(n - 1, max(-1, n - 1 - k), -1):
+            out.append({
+                "date": date.fromordinal(self.days[i]).strftime("%d/%m/%Y"),
+                "category": self.categories.values[self.category_codes[i]],
+                "amount": self.amounts[i],
+                "note": self.notes.values[self.note_codes[i]],
+                "username": self.users.values[self.user_codes[i]],
+            })
+        return out
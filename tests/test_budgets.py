@@ -0,0 +1,24 @@
+# tests/test_budgets.py
+from budgets import Budgets, OVERALL
+
+
+def test_crossed_only_between_before_and_after():
+    b = Budgets()
+    b.set("alice", OVERALL, 1000)
+    b.set("alice", "food", 100, chat_id=42)
+    assert b.crossed("alice", OVERALL, 0, 799) == []
+    assert b.crossed("alice", OVERALL, 799, 800) == [(0.8, 1000.0)]
+    assert b.crossed("alice", OVERALL, 800, 900) == []            # 80% already passed
+    assert b.crossed("alice", "food", 50, 120) == [(0.8, 100.0), (1.0, 100.0)]
+    assert b.crossed("alice", "food", 120, 90) == []              # refunds don't alert
+    assert b.crossed("alice", "taxi", 0, 1e6) == []
+    assert b.crossed("bob", OVERALL, 0, 1e6) == []
+    assert b.chats == {"alice": 42}
+
+
+def test_set_zero_removes():
+    b = Budgets()
+    b.set("alice", "food", 100)
+    assert b.watches("alice") and b.limits_for("alice") == {"food": 100.0}
+    b.set("alice", "food", 0)
+    assert not b.watches("alice") and b.limits_for("alice") == {}
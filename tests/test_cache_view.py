@@ -0,0 +1,45 @@
+# tests/test_cache_view.py
+import asyncio
+
+import handlers
+
+
+async def _add(date_s, category, amount, user="alice"):
+    async with handlers._cache_locked():
+        handlers._add_to_partition(user, date_s, category, amount)
+
+
+def test_writes_publish_a_new_view_and_leave_the_old_one_alone():
+    async def scenario():
+        async with handlers._cache_locked():
+            handlers._clear_aggregates()
+        await _add("01/09/2025", "food", 10.0)
+        before = handlers._view
+        await _add("02/09/2025", "food", 5.0)
+        await _add("02/10/2025", "rent", 100.0, user="bob")
+        after = handlers._view
+        assert after["version"] > before["version"]
+        assert before["partitions"]["alice"]["2025-09"]["total"] == 10.0
+        assert after["partitions"]["alice"]["2025-09"]["total"] == 15.0
+        assert "bob" not in before["partitions"]
+        assert after["years"] == {"alice": {"2025": 15.0}, "bob": {"2025": 100.0}}
+        assert handlers._get_partition("bob", "2025-10")["categories"] == {"rent": 100.0}
+
+    asyncio.run(scenario())
+
+
+def test_untouched_users_are_shared():
+    async def scenario():
+        async with handlers._cache_locked():
+            handlers._clear_aggregates()
+        await _add("01/09/2025", "food", 10.0)
+        await _add("01/09/2025", "food", 10.0, user="bob")
+        await _add("01/08/2025", "food", 10.0, user="bob")
+        before = handlers._view
+        await _add("03/09/2025", "food", 1.0, user="bob")
+        after = handlers._view
+        assert after["partitions"]["alice"] is before["partitions"]["alice"]
+        assert after["partitions"]["bob"]["2025-08"] is before["partitions"]["bob"]["2025-08"]
+        assert before["partitions"]["bob"]["2025-09"]["total"] == 10.0
+
+    asyncio.run(scenario())
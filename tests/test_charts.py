@@ -0,0 +1,26 @@
+# tests/test_charts.py
+from charts import bucket_points, bucket_series
+
+
+def test_bucket_series_keeps_short_series():
+    starts, sums, width = bucket_series([10, 11, 13], [1.0, 2.0, 4.0], max_points=10)
+    assert width == 1
+    assert list(starts) == [10, 11, 12, 13]
+    assert list(sums) == [1.0, 2.0, 0.0, 4.0]
+
+
+def test_bucket_series_downsamples_long_series():
+    days = list(range(1000))
+    starts, sums, width = bucket_series(days, [1.0] * 1000, max_points=90)
+    assert len(sums) <= 90
+    assert width == 12
+    assert sums.sum() == 1000
+
+
+def test_bucket_points_is_small_and_plain():
+    data = bucket_points(list(range(3 * 365)), [1.0] * (3 * 365))
+    assert len(data["points"]) <= 90
+    assert data["width"] == 13
+    assert sum(v for _, v in data["points"]) == 3 * 365
+    assert all(type(s) is int and type(v) is float for s, v in data["points"])
+    assert bucket_points([], []) == {}
@@ -0,0 +1,17 @@
+# tests/test_dayindex.py
+from datetime import date
+from dayindex import DayIndex, day_ordinal
+
+
+def test_range_total():
+    idx = DayIndex()
+    idx.add(day_ordinal("01/09/2025"), 120)
+    idx.add(day_ordinal("15/09/2025"), 30)
+    idx.add(day_ordinal("01/10/2025"), 50)
+    assert idx.range_total(day_ordinal("01/09/2025"), day_ordinal("30/09/2025")) == 150
+    assert idx.range_total(day_ordinal("02/09/2025"), day_ordinal("01/10/2025")) == 80
+    assert idx.range_total(day_ordinal("01/10/2025"), day_ordinal("01/09/2025")) == 0
+
+
+def test_day_ordinal():
+    assert day_ordinal("18/10/2026") == date(2026, 10, 18).toordinal()
@@ -0,0 +1,38 @@
+# tests/test_exporter.py
+import asyncio
+import csv
+import gzip
+from datetime import date
+
+import exporter
+import ledger
+
+
+def test_parse_range():
+    assert exporter.parse_range("2025-02") == (date(2025, 2, 1).toordinal(), date(2025, 2, 28).toordinal())
+    assert exporter.parse_range("2024") == (date(2024, 1, 1).toordinal(), date(2024, 12, 31).toordinal())
+    assert exporter.parse_range("01/09/2025:15/09/2025") == (
+        date(2025, 9, 1).toordinal(), date(2025, 9, 15).toordinal())
+
+
+def test_export_csv_streams_one_users_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger, "LEDGER_FILE", str(tmp_path / "ledger.db"))
+    monkeypatch.setattr(ledger, "_conn", None)
+    monkeypatch.setattr(exporter, "EXPORT_CHUNK_ROWS", 2)
+    rows = [
+        ["05/09/2025", "food", "10.00", "", "alice", "t1"],
+        ["01/09/2025", "rent", "500.00", "sept", "alice", "t2"],
+        ["02/09/2025", "food", "7.50", "", "bob", "t3"],
+        ["03/09/2025", "taxi", "20.00", "", "alice", "t4"],
+        ["01/10/2025", "food", "1.00", "", "alice", "t5"],
+    ]
+    asyncio.run(ledger.append_many(rows))
+    path = tmp_path / "out.csv.gz"
+    start, end = exporter.parse_range("2025-09")
+    assert exporter.export("alice", start, end, "csv", str(path)) == 3
+    with gzip.open(path, "rt", newline="") as f:
+        got = list(csv.reader(f))
+    assert got == [exporter.CSV_HEADER,
+                   ["01/09/2025", "rent", "500.00", "sept", "t2"],
+                   ["03/09/2025", "taxi", "20.00", "", "t4"],
+                   ["05/09/2025", "food", "10.00", "", "t1"]]
@@ -0,0 +1,36 @@
+# tests/test_importer.py
+import importer
+
+TODAY = "18/10/2026"
+
+
+def _run(records):
+    return importer.collect(records, TODAY)
+
+
+def test_text_lines_positional():
+    text = "food, 120\n01/10/2026, Rent, ₹15000, october\n\ntaxi, abc\n2026-10-02; groceries; 450.50"
+    res = _run(importer.text_records(text))
+    expenses = [e for _, e in res["accepted"]]
+    assert expenses == [
+        {"date": TODAY, "category": "food", "amount": 120.0, "note": ""},
+        {"date": "01/10/2026", "category": "rent", "amount": 15000.0, "note": "october"},
+        {"date": "02/10/2026", "category": "groceries", "amount": 450.5, "note": ""},
+    ]
+    assert res["rejected"] == 1
+    assert res["details"][0].startswith("line 4:")
+
+
+def test_csv_with_bank_header(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_text("Txn Date,Narration,Debit,Remarks\n05/10/2026,Coffee,80,\n06/10/2026,,90,x\n")
+    res = _run(importer.records_for_file(str(path), "statement.csv"))
+    assert [e for _, e in res["accepted"]] == [
+        {"date": "05/10/2026", "category": "coffee", "amount": 80.0, "note": ""}]
+    assert res["details"] == ["line 3: missing category"]
+
+
+def test_row_limit():
+    res = importer.collect(importer.text_records("a, 1\nb, 2\nc, 3"), TODAY, max_rows=2)
+    assert len(res["accepted"]) == 2
+    assert res["rejected"] == 1
@@ -0,0 +1,26 @@
+# tests/test_metrics.py
+from metrics import Counter, Gauge, Histogram, render
+
+
+def test_counter_and_histogram_render():
+    c = Counter("t_calls_total", "calls")
+    c.labels(kind="read", outcome="ok").inc()
+    c.labels(kind="read", outcome="ok").inc(2)
+    h = Histogram("t_latency_seconds", "latency", buckets=(0.1, 1.0))
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(5)
+    text = render()
+    assert 't_calls_total{kind="read",outcome="ok"} 3.0' in text
+    assert 't_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 't_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 't_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "t_latency_seconds_count 3" in text
+
+
+def test_gauge_callback():
+    Gauge("t_depth", "depth", lambda: 7)
+    Gauge("t_tokens", "tokens", lambda: {(("bucket", "read"),): 4})
+    text = render()
+    assert "t_depth 7.0" in text
+    assert 't_tokens{bucket="read"} 4.0' in text
@@ -0,0 +1,40 @@
+# tests/test_ratelimit.py
+import pytest
+
+import ratelimit
+from ratelimit import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_burst_then_refill(clock):
+    bucket = TokenBucket(70, burst=10)  # refills (70 - 10) / 60 = 1 token a second
+    assert [bucket.reserve() for _ in range(10)] == [0.0] * 10
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)  # queued behind the previous caller
+    clock[0] += 5.0
+    assert bucket.tokens() == pytest.approx(3.0)
+    clock[0] += 100.0
+    assert bucket.tokens() == pytest.approx(10.0)  # never above the burst
+
+
+def test_penalize_holds_the_next_caller(clock):
+    bucket = TokenBucket(70, burst=10)
+    bucket.penalize(30.0)
+    assert bucket.wait_time() == pytest.approx(31.0)
+    assert bucket.reserve() == pytest.approx(31.0)
+    assert bucket.snapshot()["throttled_seconds_total"] == pytest.approx(31.0)
+
+
+def test_small_quotas(clock):
+    bucket = TokenBucket(2)
+    assert bucket.burst == 1 and bucket.rate == pytest.approx(1 / 60)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(60.0)
+    with pytest.raises(ValueError):
+        TokenBucket(1)
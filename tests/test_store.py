@@ -0,0 +1,44 @@
+# tests/test_store.py
+from datetime import date
+
+from store import ColumnStore
+
+
+def _d(y, m, d):
+    return date(y, m, d).toordinal()
+
+
+def _store():
+    s = ColumnStore(normalize_categories=True)
+    s.append("alice", _d(2025, 9, 1), " Food ", 10.0, "lunch")
+    s.append("alice", _d(2025, 9, 2), "food", 5.5)
+    s.append("bob", _d(2025, 9, 2), "rent", 500.0)
+    s.append("alice", _d(2025, 10, 3), "Taxi", 20.0, "lunch")
+    return s
+
+
+def test_dictionary_encoding():
+    s = _store()
+    assert s.categories.values == ["food", "rent", "taxi"]
+    assert s.notes.values == ["", "lunch"]
+    assert s.nbytes() == 4 * (4 + 8 + 4 + 4 + 4)
+
+
+def test_group_by_and_filters():
+    s = _store()
+    assert s.group_by("category") == {"food": 15.5, "rent": 500.0, "taxi": 20.0}
+    assert s.group_by("month", "category", user="alice") == {
+        ("2025-09", "food"): 15.5, ("2025-10", "taxi"): 20.0}
+    assert s.group_by("year") == {"2025": 535.5}
+    assert s.group_by("user", start_day=_d(2025, 9, 2), end_day=_d(2025, 9, 30)) == {"alice": 5.5, "bob": 500.0}
+    assert s.total(user="alice", category="food") == (15.5, 2)
+    assert s.total(user="carol") == (0.0, 0)
+
+
+def test_row_count_is_a_stable_snapshot():
+    s = _store()
+    n = len(s)
+    s.append("alice", _d(2025, 9, 5), "food", 100.0)
+    assert s.total(n=n, user="alice", category="food") == (15.5, 2)
+    assert s.tail(1)[0]["amount"] == 100.0
+    assert s.tail(1, n=n)[0]["category"] == "taxi"
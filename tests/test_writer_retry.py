@@ -0,0 +1,32 @@
+# tests/test_writer_retry.py
+import asyncio
+from collections import Counter
+
+import handlers
+import ledger
+import sheets
+from bench import fake_sheets
+
+
+def test_retried_batches_do_not_duplicate_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger, "LEDGER_FILE", str(tmp_path / "ledger.db"))
+    monkeypatch.setattr(ledger, "_conn", None)
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay, *a, **kw: real_sleep(0))  # skip the backoff
+    backend = fake_sheets.FakeBackend(latency=0, applied_failure_rate=0.5, seed=3)
+    spreadsheet = fake_sheets.install(backend)
+
+    async def scenario():
+        for batch in range(10):
+            rows = [[f"{day:02d}/09/2025", "food", "1.00", "", "alice", f"tx{batch}-{day}"]
+                    for day in range(1, 4)]
+            jids = await ledger.append_many(rows)
+            month = sheets.month_for_row(rows[0])
+            assert await handlers._flush_month_batch(month, list(zip(jids, rows)))
+        return month
+
+    month = asyncio.run(scenario())
+    assert backend.errors["failure"] > 0  # some appends landed and still reported a failure
+    tx_ids = [row[5] for row in spreadsheet._sheets[month].rows[1:]]
+    assert len(tx_ids) == 30
+    assert not [t for t, n in Counter(tx_ids).items() if n > 1]